@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+流式动画编码
+
+逐帧写入 GIF / APNG / 动画 WebP，不在内存中保留全部帧：
+- GIF：所有帧共用第一帧量化得到的全局调色板（颜色偏差过大的帧自动改用局部调色板），
+  之后每帧只写入与上一帧相比发生变化的矩形区域
+- APNG：同样只写入变化区域，帧数在关闭时回填
+- WebP：逐帧送入 libwebp 动画编码器，编码器内部只保留压缩后的数据
+
+用法：
+    with AnimationWriter('out.gif', duration=1000) as writer:
+        for frame in frames:
+            writer.add_frame(frame)   # numpy 数组 (H, W, 3/4) 或 PIL 图像
+"""
+import io
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+# 根据扩展名推断输出格式
+FORMAT_EXTENSIONS = {
+    'gif': '.gif',
+    'apng': '.apng',
+    'webp': '.webp',
+}
+
+# 帧延迟计算方式的版本，变化时需要递增（参与平滑动画的增量构建输入哈希）
+TIMING_VERSION = 2
+
+# 共享调色板的平均颜色误差超过该值时，该帧改用局部调色板
+MAX_PALETTE_ERROR = 6.0
+
+
+def _changed_bbox(previous, current):
+    """返回两帧之间发生变化的矩形区域 (left, top, right, bottom)，没有变化时返回 None"""
+    diff = np.any(previous != current, axis=2)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(diff.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+class _FrameClock:
+    """
+    把每帧时长换算为整数单位的帧延迟
+
+    每帧的延迟为累计时长四舍五入后减去已写入的累计延迟，舍入误差不随帧数累积，
+    如 24fps（每帧 41.67 毫秒）的 GIF 延迟为 4、4、5、4、4、4... 厘秒，总时长与帧率一致
+
+    Parameters:
+    duration: 每帧时长（毫秒，可以是小数）
+    unit: 延迟单位（毫秒），GIF 为 10，APNG 和 WebP 为 1
+    """
+
+    def __init__(self, duration, unit):
+        self.duration = duration
+        self.unit = unit
+        self.elapsed = 0.0
+        self.total = 0
+
+    def next_delay(self):
+        """前进一帧，返回这一帧的延迟（单位数）"""
+        self.elapsed += self.duration
+        total = int(self.elapsed / self.unit + 0.5)
+        delay, self.total = total - self.total, total
+        return delay
+
+
+class _GifStream:
+    """逐帧写入 GIF 文件"""
+
+    def __init__(self, fp, duration, loop):
+        self.fp = fp
+        self.clock = _FrameClock(duration, 10)
+        self.loop = loop
+        self.palette_image = None
+        self.palette = None
+        self.previous = None
+        self.last_delay_pos = None
+        self.last_delay = 0
+
+    def _write_header(self, size):
+        palette_bytes = bytes(self.palette_image.getpalette()[:768]).ljust(768, b'\0')
+        self.fp.write(
+            b"GIF89a"
+            + struct.pack('<HH', *size)
+            + bytes([0xF7, 0, 0])  # 全局调色板，256 色
+            + palette_bytes
+        )
+        # NETSCAPE2.0 循环扩展
+        self.fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack('<H', self.loop) + b"\0")
+
+    def _extend_last_frame(self):
+        """当前帧与上一帧完全相同时，直接延长上一帧的显示时间"""
+        self.last_delay += self.clock.next_delay()
+        position = self.fp.tell()
+        self.fp.seek(self.last_delay_pos)
+        self.fp.write(struct.pack('<H', min(self.last_delay, 0xFFFF)))
+        self.fp.seek(position)
+
+    def add(self, image):
+        rgb = np.asarray(image)
+
+        if self.palette_image is None:
+            # 第一帧：量化得到共享的全局调色板
+            self.palette_image = image.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+            self.palette = np.array(self.palette_image.getpalette()[:768], dtype=np.int16).reshape(-1, 3)
+            self._write_header(image.size)
+            bbox = (0, 0) + image.size
+            # 与之后各帧使用同一种调色板映射，否则同一颜色在首帧和变化区域中的索引可能不同，
+            # 变化区域会显示为颜色略有偏差的矩形
+            indexed = image.quantize(palette=self.palette_image, dither=Image.Dither.NONE)
+            local_palette = False
+        else:
+            bbox = _changed_bbox(self.previous, rgb)
+            if bbox is None:
+                self._extend_last_frame()
+                return
+            crop = image.crop(bbox)
+            indexed = crop.quantize(palette=self.palette_image, dither=Image.Dither.NONE)
+
+            # 共享调色板无法很好表示该帧颜色时改用局部调色板
+            sample = np.asarray(crop)[::4, ::4].astype(np.int16)
+            error = np.abs(self.palette[np.asarray(indexed)[::4, ::4]] - sample).mean()
+            local_palette = error > MAX_PALETTE_ERROR
+            if local_palette:
+                indexed = crop.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+        # disposal=1：保留上一帧内容，只覆盖变化区域（PIL 以毫秒接收延迟，写入时换算为厘秒）
+        delay = self.clock.next_delay()
+        chunks = GifImagePlugin.getdata(
+            indexed, offset=bbox[:2], duration=delay * 10, disposal=1,
+            include_color_table=local_palette)
+        if chunks and chunks[0][:2] == b"!\xf9":
+            self.last_delay_pos = self.fp.tell() + 4
+            self.last_delay = delay
+        for chunk in chunks:
+            self.fp.write(chunk)
+
+        self.previous = rgb
+
+    def close(self):
+        self.fp.write(b";")
+
+
+def _png_chunk(chunk_type, data):
+    """构造一个 PNG 数据块"""
+    return (struct.pack('>I', len(data)) + chunk_type + data
+            + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+
+def _encode_png_chunks(image):
+    """用 PIL 编码 PNG，返回 (IHDR 数据, IDAT 数据列表)"""
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    data = buffer.getvalue()
+    pos = 8
+    ihdr, idat = None, []
+    while pos < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk_data = data[pos + 8:pos + 8 + length]
+        if chunk_type == b'IHDR':
+            ihdr = chunk_data
+        elif chunk_type == b'IDAT':
+            idat.append(chunk_data)
+        pos += 12 + length
+    return ihdr, idat
+
+
+class _ApngStream:
+    """逐帧写入 APNG 文件"""
+
+    def __init__(self, fp, duration, loop):
+        self.fp = fp
+        self.clock = _FrameClock(duration, 1)
+        self.loop = loop
+        self.sequence = 0
+        self.frame_count = 0
+        self.previous = None
+        self.actl_pos = None
+        self.last_fctl = None
+
+    def _write_fctl(self, bbox, delay):
+        left, top, right, bottom = bbox
+        self.last_fctl = [self.fp.tell(), self.sequence, bbox, delay]
+        data = struct.pack('>IIIIIHHBB', self.sequence, right - left, bottom - top,
+                           left, top, min(delay, 0xFFFF), 1000, 0, 0)
+        self.fp.write(_png_chunk(b'fcTL', data))
+        self.sequence += 1
+
+    def add(self, image):
+        rgb = np.asarray(image)
+
+        if self.previous is None:
+            bbox = (0, 0) + image.size
+            ihdr, idat = _encode_png_chunks(image)
+            self.fp.write(b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', ihdr))
+            # 帧数在关闭时回填
+            self.actl_pos = self.fp.tell()
+            self.fp.write(_png_chunk(b'acTL', struct.pack('>II', 0, self.loop)))
+            self._write_fctl(bbox, self.clock.next_delay())
+            for data in idat:
+                self.fp.write(_png_chunk(b'IDAT', data))
+        else:
+            bbox = _changed_bbox(self.previous, rgb)
+            if bbox is None:
+                # 与上一帧相同：延长上一帧的显示时间
+                position, sequence, last_bbox, delay = self.last_fctl
+                next_sequence = self.sequence
+                self.fp.seek(position)
+                self.sequence = sequence
+                self._write_fctl(last_bbox, delay + self.clock.next_delay())
+                self.sequence = next_sequence
+                self.fp.seek(0, os.SEEK_END)
+                return
+            _, idat = _encode_png_chunks(image.crop(bbox))
+            self._write_fctl(bbox, self.clock.next_delay())
+            for data in idat:
+                self.fp.write(_png_chunk(b'fdAT', struct.pack('>I', self.sequence) + data))
+                self.sequence += 1
+
+        self.frame_count += 1
+        self.previous = rgb
+
+    def close(self):
+        self.fp.write(_png_chunk(b'IEND', b''))
+        if self.actl_pos is not None:
+            self.fp.seek(self.actl_pos)
+            self.fp.write(_png_chunk(b'acTL', struct.pack('>II', self.frame_count, self.loop)))
+            self.fp.seek(0, os.SEEK_END)
+
+
+class _WebPStream:
+    """逐帧送入 libwebp 动画编码器"""
+
+    def __init__(self, fp, duration, loop, quality=80, lossless=False):
+        from PIL import _webp
+        self.fp = fp
+        self.webp = _webp
+        self.clock = _FrameClock(duration, 1)
+        self.loop = loop
+        self.quality = quality
+        self.lossless = lossless
+        self.encoder = None
+
+    def add(self, image):
+        if self.encoder is None:
+            # 参数顺序与 PIL.WebPImagePlugin._save_all 一致
+            self.encoder = self.webp.WebPAnimEncoder(
+                image.size, 0xFFFFFFFF, self.loop, False,
+                9 if self.lossless else 3, 17 if self.lossless else 5, False, False)
+        # 时间戳为这一帧的开始时间
+        self.encoder.add(image.getim(), self.clock.total, self.lossless, self.quality, 100, 0)
+        self.clock.next_delay()
+
+    def close(self):
+        if self.encoder is None:
+            return
+        self.encoder.add(None, self.clock.total, self.lossless, self.quality, 100, 0)
+        data = self.encoder.assemble("", "", "")
+        if data is None:
+            raise OSError("WebP 编码失败")
+        self.fp.write(data)
+
+
+class AnimationWriter:
+    """
+    流式动画写入器
+
+    Parameters:
+    path: 输出文件路径
+    fmt: 'gif'、'apng' 或 'webp'，默认根据扩展名推断
+    duration: 每帧持续时间（毫秒，可以是小数，各帧延迟的舍入误差不累积）
+    loop: 循环次数，0 表示无限循环
+    scale: 缩放比例，小于 1 时先缩小再编码
+    """
+
+    def __init__(self, path, fmt=None, duration=1000, loop=0, scale=1.0):
+        if fmt is None:
+            extension = os.path.splitext(path)[1].lower()
+            fmt = {ext: name for name, ext in FORMAT_EXTENSIONS.items()}.get(extension, 'gif')
+        if fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"不支持的动画格式: {fmt}")
+
+        self.path = path
+        self.fmt = fmt
+        self.scale = scale
+        self.size = None
+        self.frame_count = 0
+        self.fp = open(path, 'wb')
+        stream_classes = {'gif': _GifStream, 'apng': _ApngStream, 'webp': _WebPStream}
+        self.stream = stream_classes[fmt](self.fp, duration, loop)
+
+    def _prepare(self, frame):
+        """转换为 RGB 图像，按需缩放，并与第一帧尺寸对齐"""
+        if isinstance(frame, np.ndarray):
+            image = Image.fromarray(np.ascontiguousarray(frame[..., :3]), 'RGB')
+        else:
+            image = frame.convert('RGB')
+
+        if self.scale != 1.0:
+            new_size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+            image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+        if self.size is None:
+            self.size = image.size
+        elif image.size != self.size:
+            # 帧尺寸不一致时（如紧凑边界略有差异），以白色背景补齐或裁剪到第一帧尺寸
+            canvas = Image.new('RGB', self.size, 'white')
+            canvas.paste(image, (0, 0))
+            image = canvas
+        return image
+
+    def add_frame(self, frame):
+        """写入一帧"""
+        self.stream.add(self._prepare(frame))
+        self.frame_count += 1
+
+    def close(self):
+        """结束编码并关闭文件"""
+        if self.fp.closed:
+            return
+        try:
+            self.stream.close()
+        finally:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
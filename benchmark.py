@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+
+生成指定规模的合成数据（区域边界 GeoJSON、shrink_ratio.csv、customer_num.csv、heat_map.csv），
+在临时目录中分阶段计时，结果写入 JSON 文件，并可与保存的基准结果对比。
+
+用法：
+    python benchmark.py --districts 200 --vertices 400 --periods 12 --output bench.json
+    python benchmark.py --baseline bench.json          # 与基准结果对比，出现回退时退出码为 1
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+# 结果文件格式版本
+RESULTS_VERSION = 1
+
+# 对比基准时，耗时超过基准的该倍数视为性能回退
+DEFAULT_THRESHOLD = 1.2
+
+# 耗时增加不足该秒数时不视为回退（避免很短的阶段因计时噪声误报）
+MIN_REGRESSION_SECONDS = 0.05
+
+# 合成区域的经纬度范围（与 map.geojson 相同的区域，EPSG:4490）
+SYNTHETIC_BOUNDS = (105.3, 28.2, 110.2, 32.2)
+
+# 所有计时阶段（按执行顺序）
+STAGES = [
+    'load_reproject',   # 解析 GeoJSON 并投影（生成几何缓存）
+    'load_cached',      # 从几何缓存读取
+    'inset_index',      # 计算内缩曲线
+    'inset_solve',      # 按目标面积比例求内缩几何体
+    'gradient_layers',  # 生成矢量渐变层
+    'draw',             # 栅格化底图并合成标注叠加层
+    'savefig',          # 编码并保存地图帧
+    'gif_encode',       # 编码 GIF 动画
+    'heatmap',          # 热力图
+    'report',           # 分析报告
+    'report_streaming', # 分块流式分析报告
+]
+
+
+def generate_districts(num_districts, vertices, seed=0, bounds=SYNTHETIC_BOUNDS):
+    """
+    生成互不重叠、公共边界完全重合的合成区域
+
+    以随机点的 Voronoi 图划分范围，边界按目标顶点数加密，
+    再对所有坐标施加同一个平滑位移场，使边界弯曲但相邻区域仍然严丝合缝。
+
+    Parameters:
+    num_districts: 区域数量
+    vertices: 每个区域的大致顶点数
+    seed: 随机种子
+    bounds: 经纬度范围 (min_x, min_y, max_x, max_y)
+
+    Returns:
+    list: shapely Polygon 列表
+    """
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    min_x, min_y, max_x, max_y = bounds
+    points = np.column_stack([rng.uniform(min_x, max_x, num_districts),
+                              rng.uniform(min_y, max_y, num_districts)])
+    extent = shapely.box(*bounds)
+    cells = shapely.voronoi_polygons(shapely.multipoints(points), extend_to=extent)
+    polygons = shapely.intersection(shapely.get_parts(cells), extent)
+
+    # 按目标顶点数加密边界（按平均周长估算分段长度）
+    segment = shapely.length(polygons).mean() / max(vertices, 4)
+    polygons = shapely.segmentize(polygons, segment)
+
+    # 平滑位移场：相同坐标位移相同，公共边界仍然重合；
+    # 振幅控制在位移梯度远小于 1，保证变换不会使边界折叠自交
+    width, height = max_x - min_x, max_y - min_y
+    amplitude = min(width, height) / np.sqrt(num_districts) * 0.04
+    frequency = np.sqrt(num_districts) * 2 * np.pi
+
+    def displace(coords):
+        x = (coords[:, 0] - min_x) / width
+        y = (coords[:, 1] - min_y) / height
+        dx = amplitude * np.sin(frequency * y * 1.7 + 3 * np.sin(frequency * x * 0.3))
+        dy = amplitude * np.sin(frequency * x * 1.3 + 3 * np.sin(frequency * y * 0.4))
+        return np.column_stack([coords[:, 0] + dx, coords[:, 1] + dy])
+
+    return list(shapely.transform(polygons, displace))
+
+
+def write_synthetic_data(directory, num_districts=38, vertices=150, periods=4,
+                         matched_fraction=0.25, seed=0):
+    """
+    在指定目录写入合成数据文件
+
+    Parameters:
+    directory: 输出目录
+    num_districts: 区域数量
+    vertices: 每个区域的大致顶点数
+    periods: 期数（年份列数）
+    matched_fraction: 有比例数据的区域占比
+    seed: 随机种子
+
+    Returns:
+    dict: 数据规模信息
+    """
+    import pandas as pd
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    polygons = generate_districts(num_districts, vertices, seed=seed)
+    names = [f"区域{i:04d}" for i in range(num_districts)]
+
+    features = [
+        {'type': 'Feature', 'properties': {'name': name},
+         'geometry': json.loads(shapely.to_geojson(polygon))}
+        for name, polygon in zip(names, polygons)
+    ]
+    geojson = {
+        'type': 'FeatureCollection',
+        'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:EPSG::4490'}},
+        'features': features,
+    }
+    with open(os.path.join(directory, 'map.geojson'), 'w', encoding='utf-8') as f:
+        json.dump(geojson, f, ensure_ascii=False)
+
+    years = [str(2000 + i) for i in range(periods)]
+    matched = sorted(rng.choice(num_districts, max(1, int(num_districts * matched_fraction)), replace=False))
+    matched_names = [names[i] for i in matched]
+
+    # 比例从 1 逐期递减，客户数量随之减少
+    ratios = np.sort(rng.uniform(0.05, 1.0, (len(matched_names), periods)), axis=1)[:, ::-1]
+    customers = np.round(ratios * rng.integers(100, 5000, (len(matched_names), 1))).astype(int)
+    ratio_df = pd.DataFrame(ratios, columns=years)
+    ratio_df.insert(0, 'district', matched_names)
+    customer_df = pd.DataFrame(customers, columns=years)
+    customer_df.insert(0, 'district', matched_names)
+    ratio_df.to_csv(os.path.join(directory, 'shrink_ratio.csv'), index=False)
+    customer_df.to_csv(os.path.join(directory, 'customer_num.csv'), index=False)
+
+    # 热力图数据：每个有数据的区域每期一行
+    churn_rate = 1 - ratios
+    heat_df = pd.DataFrame({
+        '区名': np.repeat(matched_names, periods),
+        '年份': np.tile([int(year) for year in years], len(matched_names)),
+        '累计客户流失数量': np.round(churn_rate * customers.max(axis=1, keepdims=True)).astype(int).ravel(),
+        '客户流失率': churn_rate.ravel(),
+    })
+    heat_df.to_csv(os.path.join(directory, 'heat_map.csv'), index=False, encoding='utf-8')
+
+    return {
+        'districts': num_districts,
+        'vertices': int(shapely.get_num_coordinates(polygons).sum()),
+        'periods': periods,
+        'matched_districts': len(matched_names),
+    }
+
+
+class StageTimer:
+    """记录各阶段耗时（同一阶段多次计时累加）"""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] = self.times.get(stage, 0.0) + time.perf_counter() - start
+
+
+def run_stages(timer):
+    """在当前目录（已写入合成数据）中依次运行并计时各阶段"""
+    import map as map_module
+    import heatmap
+
+    plt = map_module.get_pyplot()
+
+    with timer.measure('load_reproject'):
+        map_module.get_gdf()
+    map_module._data_cache.pop('gdf', None)
+    map_module._data_cache.pop('render_gdf', None)
+    with timer.measure('load_cached'):
+        map_module.get_render_gdf()
+
+    years = map_module.get_years()
+
+    with timer.measure('inset_index'):
+        map_module.prepare_inset_index()
+
+    for year in years:
+        # 与 compute_year_geometry 相同的两个步骤，分别计时内缩和渐变层
+        with timer.measure('inset_solve'):
+            year_geometry = map_module.compute_year_insets(year)
+        with timer.measure('gradient_layers'):
+            map_module.add_gradient_layers(year_geometry)
+
+        with timer.measure('draw'):
+            # 与 render_maps_for_year 相同：复用的渲染器首次使用时创建静态图层
+            image = map_module.get_frame_renderer().render_images(
+                year_geometry, ['partial'], map_module.render_settings['dpi'])['partial']
+
+        with timer.measure('savefig'):
+            # 同步编码和写盘
+            map_module.save_frame(image, map_module.get_frame_path(year, 'partial'))
+
+    with timer.measure('gif_encode'):
+        map_module.create_gif_for_mode(years, 'partial', force=True)
+
+    with timer.measure('heatmap'):
+        heatmap.create_heatmap()
+    plt.close('all')
+
+    # 两种报告都从冷缓存开始计时，包含读取 CSV 和统计，不复用热力图阶段的统计结果
+    heatmap._stats_cache.clear()
+    with timer.measure('report'):
+        heatmap.generate_analysis_report(streaming=False)
+    heatmap._stats_cache.clear()
+    with timer.measure('report_streaming'):
+        heatmap.generate_analysis_report(streaming=True)
+
+
+def reset_modules():
+    """清除各模块的进程内缓存，保证每轮计时都从冷启动开始"""
+    map_module = sys.modules.get('map')
+    if map_module is not None:
+        map_module._data_cache.clear()
+        map_module._inset_index = None
+    heatmap = sys.modules.get('heatmap')
+    if heatmap is not None:
+        heatmap._stats_cache.clear()
+
+
+def run_benchmark(num_districts=38, vertices=150, periods=4, matched_fraction=0.25,
+                  seed=0, repeat=1, keep=False):
+    """
+    生成合成数据并运行基准测试
+
+    Returns:
+    dict: 基准测试结果（每个阶段取多轮中的最小耗时）
+    """
+    # 基准测试不弹出窗口
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+
+    # 预先导入较重的库，导入耗时不计入任何阶段
+    for module in ('geopandas', 'matplotlib.pyplot', 'seaborn'):
+        importlib.import_module(module)
+
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='map_benchmark_')
+    runs = []
+    try:
+        os.chdir(work_dir)
+        print(f"生成合成数据：{num_districts} 个区域，每个约 {vertices} 个顶点，{periods} 期")
+        dataset = write_synthetic_data(work_dir, num_districts, vertices, periods, matched_fraction, seed)
+
+        for i in range(repeat):
+            # 每轮从冷启动开始：清除缓存目录、输出目录和模块缓存
+            for directory in ('map_cache', 'map_outputs'):
+                shutil.rmtree(os.path.join(work_dir, directory), ignore_errors=True)
+            reset_modules()
+
+            timer = StageTimer()
+            run_stages(timer)
+            runs.append(timer.times)
+            print(f"第 {i + 1}/{repeat} 轮完成：" +
+                  "，".join(f"{stage} {timer.times[stage]:.2f}s" for stage in STAGES if stage in timer.times))
+    finally:
+        os.chdir(original_dir)
+        if keep:
+            print(f"保留临时目录：{work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    import matplotlib
+    import shapely
+
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'parameters': {
+            'districts': num_districts,
+            'vertices': vertices,
+            'periods': periods,
+            'matched_fraction': matched_fraction,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'dataset': dataset,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'shapely': shapely.__version__,
+            'geos': '.'.join(str(part) for part in shapely.geos_version),
+            'matplotlib': matplotlib.__version__,
+        },
+        'stages': {
+            stage: {'seconds': min(run[stage] for run in runs), 'runs': [run[stage] for run in runs]}
+            for stage in STAGES if all(stage in run for run in runs)
+        },
+    }
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    对比本次结果和基准结果，打印对比表
+
+    Returns:
+    list: 出现性能回退的阶段名称
+    """
+    def scale(parameters):
+        return {key: value for key, value in parameters.items() if key != 'repeat'}
+
+    if scale(baseline.get('parameters', {})) != scale(results['parameters']):
+        print("注意：基准结果的数据规模参数与本次不同，对比结果仅供参考")
+
+    regressions = []
+    print(f"\n{'阶段':<20}{'基准(s)':>10}{'本次(s)':>10}{'比例':>8}")
+    for stage, current in results['stages'].items():
+        reference = baseline.get('stages', {}).get(stage)
+        if reference is None:
+            print(f"{stage:<20}{'-':>10}{current['seconds']:>10.3f}{'-':>8}")
+            continue
+        ratio = current['seconds'] / reference['seconds'] if reference['seconds'] > 0 else float('inf')
+        flag = ''
+        if ratio > threshold and current['seconds'] - reference['seconds'] > MIN_REGRESSION_SECONDS:
+            regressions.append(stage)
+            flag = '  <- 回退'
+        print(f"{stage:<20}{reference['seconds']:>10.3f}{current['seconds']:>10.3f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def parse_args(argv):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="地图生成流程性能基准测试")
+    parser.add_argument('--districts', type=int, default=38, help="区域数量")
+    parser.add_argument('--vertices', type=int, default=150, help="每个区域的大致顶点数")
+    parser.add_argument('--periods', type=int, default=4, help="期数（年份列数）")
+    parser.add_argument('--matched', type=float, default=0.25, help="有比例数据的区域占比")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--repeat', type=int, default=1, help="重复轮数，每个阶段取最小耗时")
+    parser.add_argument('--output', default='benchmark_results.json', help="结果文件路径")
+    parser.add_argument('--baseline', default=None, help="用于对比的基准结果文件")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="耗时超过基准的该倍数视为回退")
+    parser.add_argument('--keep', action='store_true', help="保留临时目录（合成数据和输出文件）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """运行基准测试，返回进程退出码"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    results = run_benchmark(args.districts, args.vertices, args.periods, args.matched,
+                            args.seed, args.repeat, args.keep)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"结果已保存：{args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"性能回退：{', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
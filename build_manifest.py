@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+增量构建清单
+
+记录每个输出文件的输入哈希，输入没有变化且文件存在时跳过重新生成。
+清单可能被多个渲染进程同时更新，写入时使用锁文件串行化。
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# 清单格式版本
+MANIFEST_VERSION = 1
+
+# 锁文件超过该时间（秒）仍未释放时视为残留锁
+STALE_LOCK_SECONDS = 60
+
+
+def hash_inputs(*parts):
+    """计算若干输入（字符串或可 JSON 序列化对象）的组合哈希"""
+    digest = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, (str, bytes)):
+            part = json.dumps(part, sort_keys=True, ensure_ascii=False)
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(hashlib.sha1(part).digest())
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    """读取清单，文件不存在或已损坏时返回空清单"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError) as e:
+            print(f"读取构建清单失败，将全部重新生成: {e}")
+    return {'version': MANIFEST_VERSION, 'outputs': {}}
+
+
+def is_up_to_date(manifest, key, input_hash, output_path):
+    """判断输出是否为最新：哈希一致且输出文件存在"""
+    entry = manifest['outputs'].get(key)
+    return entry is not None and entry.get('hash') == input_hash and os.path.exists(output_path)
+
+
+@contextmanager
+def _locked(path):
+    """基于锁文件的跨进程互斥"""
+    lock_path = f"{path}.lock"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def update_manifest(path, entries):
+    """
+    合并更新清单条目
+
+    Parameters:
+    path: 清单文件路径
+    entries: {输出键: {'hash': 输入哈希, ...其他需要缓存的信息}}
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _locked(path):
+        manifest = load_manifest(path)
+        manifest['outputs'].update(entries)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
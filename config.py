@@ -3,13 +3,19 @@
 """
 Configuration script - Unified management of map generation and heatmap generation
 Supports multiple region name display modes and batch processing
+
+Run without arguments for the interactive menu, or pass arguments for a
+non-interactive batch run (see `python config.py --help`).
 """
 
 import sys
 import os
 import subprocess
+import argparse
 from datetime import datetime
 
+MAP_MODES = ['all', 'partial', 'none']
+
 def print_banner():
     """Print program banner"""
     print("=" * 70)
@@ -34,8 +40,8 @@ def print_menu():
     print("0. Exit")
     print("-" * 50)
 
-def run_map_generation(display_modes):
-    """Run map generation"""
+def run_map_generation(display_modes, workers=1):
+    """Run map generation (workers > 1 renders years in parallel processes)"""
     print(f"\nStarting map generation, mode: {display_modes}")
     
     try:
@@ -51,7 +57,7 @@ def run_map_generation(display_modes):
             run_mode = 'multiple'
         
         # Run map generation
-        results = map_module.main(run_mode=run_mode, display_modes=display_modes)
+        results = map_module.main(run_mode=run_mode, display_modes=display_modes, workers=workers)
         
         print("Map generation completed!")
         return True
@@ -261,5 +267,188 @@ def main():
                 print("\nGoodbye!")
                 break
 
+def build_job_graph(modes, years, heatmap=False, report=False, gif=True, force=False,
+                    stream_report=False, tile_zooms=None, vector_format=None, smooth_fps=None,
+                    tile_workers=1):
+    """
+    Build the batch job graph: frames per year -> GIF per mode, tiles per year,
+    vector layers per year -> vector index; the heatmap and report run independently
+    of the maps, in one job when both are requested.
+    Each tile job spreads its tiles over tile_workers processes.
+    """
+    import jobs
+    import map as map_module
+    import heatmap as heatmap_module
+    
+    graph = {}
+    if modes or tile_zooms or vector_format:
+        # Inset curves are computed once up front so frame and tile jobs never race on the cache file
+        graph['inset-index'] = jobs.make_job(map_module.prepare_inset_index)
+    if modes:
+        for year in years:
+            graph[f'frames:{year}'] = jobs.make_job(
+                map_module.render_year, year, modes, None, force, deps=['inset-index'])
+        if gif:
+            for mode in modes:
+                graph[f'gif:{mode}'] = jobs.make_job(
+                    map_module.create_gif_for_mode, years, mode, 'gif', 1.0, force,
+                    deps=[f'frames:{year}' for year in years])
+        if smooth_fps:
+            # One job for all modes: every interpolated frame's geometry and base image are shared
+            graph['smooth'] = jobs.make_job(
+                map_module.create_smooth_animation, years, modes, 'gif', smooth_fps,
+                None, None, None, force, deps=['inset-index'])
+    if tile_zooms:
+        # One job per year computes the year geometry once; write_pyramid spreads the
+        # tile batches of every zoom level over the tile workers
+        for year in years:
+            graph[f'tiles:{year}'] = jobs.make_job(
+                map_module.render_tiles, year, tile_zooms, tile_workers, force, deps=['inset-index'])
+    if vector_format:
+        for year in years:
+            graph[f'vector:{year}'] = jobs.make_job(
+                map_module.export_year_layers, year, vector_format, force, deps=['inset-index'])
+        graph['vector:index'] = jobs.make_job(
+            map_module.write_vector_index, years, vector_format,
+            deps=[f'vector:{year}' for year in years])
+    # None lets the report pick streaming mode by file size
+    report_streaming = True if stream_report else None
+    if heatmap and report and not stream_report:
+        # One job so the heatmap and the report share a single statistics pass (as menu option 7 does)
+        graph['heatmap-report'] = jobs.make_job(heatmap_module.create_heatmap_and_report, report_streaming)
+    else:
+        if heatmap:
+            graph['heatmap'] = jobs.make_job(heatmap_module.create_heatmap)
+        if report:
+            graph['report'] = jobs.make_job(heatmap_module.generate_analysis_report, report_streaming)
+    return graph
+
+def parse_args(argv):
+    """Parse batch mode command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Area data visualization tool - non-interactive batch mode")
+    parser.add_argument('--modes', nargs='+', choices=MAP_MODES, default=[],
+                        help="map display modes to generate")
+    parser.add_argument('--years', nargs='+', default=None,
+                        help="years to render (default: all years in shrink_ratio.csv)")
+    parser.add_argument('--heatmap', action='store_true', help="generate the heatmap")
+    parser.add_argument('--report', action='store_true', help="generate the analysis report")
+    parser.add_argument('--all', action='store_true',
+                        help="all 3 map modes + heatmap + analysis report (menu option 7)")
+    parser.add_argument('--stream-report', action='store_true',
+                        help="compute the analysis report by streaming the CSV in chunks "
+                             "(automatic for very large files)")
+    parser.add_argument('--no-gif', action='store_true', help="skip GIF animation generation")
+    parser.add_argument('--smooth', type=int, nargs='?', const=24, default=None, metavar='FPS',
+                        help="also render a smooth GIF per mode with interpolated frames between "
+                             "years (default: 24 fps when given without a value)")
+    parser.add_argument('--tiles', action='store_true',
+                        help="render an XYZ tile pyramid per year into map_outputs/tiles/<year>/z/x/y.png")
+    parser.add_argument('--vector', nargs='?', const='json', choices=['json', 'parquet'], default=None,
+                        help="export per-year cores, gradient rings and validation results to "
+                             "map_outputs/vector/: quantized delta-encoded JSON (default) or "
+                             "GeoParquet (requires pyarrow)")
+    parser.add_argument('--tile-zooms', type=int, nargs=2, default=None, metavar=('MIN', 'MAX'),
+                        help="tile zoom level range, inclusive (default: 6 10)")
+    parser.add_argument('--simplify', type=float, nargs='?', const=1.0, default=None, metavar='PIXELS',
+                        help="simplify district boundaries before rendering, tolerance in output "
+                             "pixels (default: 1.0 when given without a value)")
+    parser.add_argument('--renderer', choices=['vector', 'raster'], default=None,
+                        help="fill renderer: vector buffer gradients (default) or "
+                             "raster distance-transform gradients")
+    parser.add_argument('--frame-format', choices=['png', 'png-palette', 'webp'], default=None,
+                        help="map frame format: RGB PNG (default), 256-colour palette PNG "
+                             "(about a third of the size) or lossy WebP")
+    parser.add_argument('--png-compress', type=int, choices=range(10), default=None, metavar='LEVEL',
+                        help="PNG zlib compression level 0-9 (default: 6); lower is faster, larger")
+    parser.add_argument('--force', action='store_true',
+                        help="ignore the build manifest and regenerate every output")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help="record per-stage timings, call counts and peak memory, "
+                             "and write them to PATH")
+    parser.add_argument('--trace-format', choices=['chrome', 'json'], default='chrome',
+                        help="trace file format: Chrome trace (chrome://tracing, Perfetto) "
+                             "or plain JSON events with a summary (default: chrome)")
+    args = parser.parse_args(argv)
+    
+    if args.all:
+        args.modes = list(MAP_MODES)
+        args.heatmap = True
+        args.report = True
+    if not (args.modes or args.tiles or args.vector or args.heatmap or args.report):
+        parser.error("nothing to do: pass --modes, --tiles, --vector, --heatmap, --report or --all")
+    if args.smooth is not None and not args.modes:
+        parser.error("--smooth needs --modes or --all")
+    if args.smooth is not None and not 1 <= args.smooth <= 60:
+        parser.error("--smooth FPS must be between 1 and 60")
+    if args.tile_zooms and not 0 <= args.tile_zooms[0] <= args.tile_zooms[1] <= 22:
+        parser.error("--tile-zooms must satisfy 0 <= MIN <= MAX <= 22")
+    return args
+
+def run_batch(argv):
+    """Run a non-interactive batch job, return the process exit status"""
+    args = parse_args(argv)
+    
+    # Headless run: never open windows, plt.show() becomes a no-op
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    # Read by map.render_settings at import time, so worker processes inherit them too
+    if args.simplify is not None:
+        os.environ['MAP_SIMPLIFY_PIXELS'] = str(args.simplify)
+    if args.renderer is not None:
+        os.environ['MAP_RENDERER'] = args.renderer
+    if args.frame_format is not None:
+        os.environ['MAP_OUTPUT_FORMAT'] = args.frame_format
+    if args.png_compress is not None:
+        os.environ['MAP_PNG_COMPRESS'] = str(args.png_compress)
+    
+    import jobs
+    import map as map_module
+    import tracing
+    
+    if args.trace:
+        # Also exported to the environment so worker processes record events too
+        tracing.enable()
+    
+    years = []
+    if args.modes or args.tiles or args.vector:
+        available_years = map_module.get_years()
+        years = args.years or available_years
+        unknown_years = [year for year in years if year not in available_years]
+        if unknown_years:
+            print(f"Unknown years: {unknown_years}, available: {available_years}")
+            return 2
+    
+    tile_zooms = None
+    if args.tiles:
+        zoom_range = args.tile_zooms or map_module.tile_zooms
+        tile_zooms = list(range(zoom_range[0], zoom_range[1] + 1))
+    
+    graph = build_job_graph(args.modes, years, heatmap=args.heatmap,
+                            report=args.report, gif=not args.no_gif, force=args.force,
+                            stream_report=args.stream_report, tile_zooms=tile_zooms,
+                            vector_format=args.vector, smooth_fps=args.smooth,
+                            tile_workers=max(1, args.workers // max(1, len(years))))
+    
+    print(f"Running {len(graph)} jobs with {args.workers} worker(s)")
+    start = datetime.now()
+    results = jobs.run_job_graph(graph, workers=args.workers)
+    elapsed = (datetime.now() - start).total_seconds()
+    
+    failed = [name for name, result in results.items() if result['status'] != 'ok']
+    print("-" * 50)
+    for name, result in results.items():
+        print(f"  {result['status']:8s} {name} ({result['elapsed']:.1f}s)")
+    print(f"Finished in {elapsed:.1f}s, {len(results) - len(failed)}/{len(results)} jobs succeeded")
+    
+    if args.trace:
+        tracing.print_summary()
+        tracing.save(args.trace, fmt=args.trace_format)
+    
+    return 1 if failed else 0
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_batch(sys.argv[1:]))
     main()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+地图帧输出
+
+把渲染好的 RGBA 数组编码并写入文件，编码和写盘可以交给后台线程，与下一帧的渲染并行。
+
+输出格式：
+- png：RGB PNG（底图不透明，不写 alpha 通道），zlib 压缩级别可选（0-9，默认 6）
+- png-palette：256 色调色板 PNG，地图颜色很少，文件约为 RGB PNG 的三分之一
+- webp：有损 WebP（质量 90）
+
+用法：
+    with FrameWriter() as writer:
+        for image, path in frames:
+            writer.submit(image, path, 'png', compress_level=6, dpi=300)
+    # 退出时等待所有帧写完，后台线程中出现的第一个错误在这里重新抛出
+"""
+import os
+import queue
+import threading
+
+import numpy as np
+from PIL import Image
+
+import tracing
+
+# 输出格式及扩展名
+FORMAT_EXTENSIONS = {
+    'png': '.png',
+    'png-palette': '.png',
+    'webp': '.webp',
+}
+
+# 默认 PNG 压缩级别（与 PIL、matplotlib 的默认值相同）
+DEFAULT_COMPRESS_LEVEL = 6
+
+# 有损 WebP 质量
+WEBP_QUALITY = 90
+
+# 后台写入队列最多等待的帧数，渲染快于写入时阻塞渲染，避免帧在内存中堆积
+MAX_PENDING_FRAMES = 2
+
+
+def encode_frame(image, path, fmt='png', compress_level=DEFAULT_COMPRESS_LEVEL, dpi=None):
+    """
+    编码并写入一帧（先写临时文件再替换，中断时不会留下不完整的文件）
+
+    Parameters:
+    image: RGBA 或 RGB 数组
+    path: 输出文件路径
+    fmt: 'png'、'png-palette' 或 'webp'
+    compress_level: PNG 压缩级别
+    dpi: 写入文件的分辨率信息
+    """
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+
+    # 在后台线程中执行时同样记录为 savefig 阶段
+    with tracing.span('savefig', format=fmt, path=path):
+        rgb = Image.fromarray(np.ascontiguousarray(np.asarray(image)[..., :3]), 'RGB')
+        options = {'dpi': (dpi, dpi)} if dpi else {}
+        if fmt == 'png':
+            rgb_image, save_format = rgb, 'PNG'
+            options['compress_level'] = compress_level
+        elif fmt == 'png-palette':
+            # 中位切分量化保留白色背景和底色的原始颜色，不抖动，避免在纯色区域产生噪点
+            rgb_image = rgb.quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+            save_format = 'PNG'
+            options['compress_level'] = compress_level
+        else:
+            rgb_image, save_format = rgb, 'WEBP'
+            options['quality'] = WEBP_QUALITY
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            rgb_image.save(tmp_path, save_format, **options)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class FrameWriter:
+    """
+    后台帧写入线程
+
+    submit() 把帧放入有界队列后立即返回，后台线程依次编码写入，写完后调用可选的回调
+    （如更新构建清单，保证清单只记录已写入的文件）。出错后不再写入后续的帧，
+    错误在下一次 submit() 或 close() 时重新抛出。
+
+    Parameters:
+    max_pending: 队列中最多等待的帧数
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_FRAMES):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.failed = False
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name='frame-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                if self.failed:
+                    continue
+                image, path, fmt, compress_level, dpi, callback = task
+                try:
+                    encode_frame(image, path, fmt, compress_level, dpi)
+                    if callback is not None:
+                        callback(path)
+                    self.written += 1
+                except Exception as e:
+                    self.error = e
+                    self.failed = True
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, image, path, fmt='png', compress_level=DEFAULT_COMPRESS_LEVEL, dpi=None, callback=None):
+        """
+        提交一帧，队列已满时等待
+
+        image 在写入完成前不能被修改
+        """
+        self._raise_error()
+        self.queue.put((image, path, fmt, compress_level, dpi, callback))
+
+    def flush(self):
+        """等待已提交的帧全部写完"""
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        """等待所有帧写完并结束后台线程"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 已经有异常时仍等待写完，但不让写入错误覆盖原来的异常
+            try:
+                self.close()
+            except Exception as e:
+                print(f"写入地图帧时出错: {e}")
+        return False
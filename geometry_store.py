@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+预投影几何体二进制缓存
+
+首次读取 GeoJSON 时完成解析和投影，并把坐标、偏移数组保存为 .npy 文件，
+属性字段保存为 JSON。之后直接以内存映射方式读取坐标数组构建 shapely 几何体，
+启动耗时不再随 GeoJSON 解析和重投影的开销增长。源文件内容变化后自动重建。
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+import tracing
+
+# 缓存格式版本，存储结构变化时需要递增
+STORE_VERSION = 1
+
+
+def source_hash(source_path, epsg):
+    """计算源文件内容和目标投影的哈希值"""
+    digest = hashlib.sha1()
+    digest.update(f"geometry-store-v{STORE_VERSION}:epsg{epsg}".encode('utf-8'))
+    with open(source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store_prefix(source_path):
+    """缓存目录名前缀（源文件名）"""
+    return os.path.splitext(os.path.basename(source_path))[0] + '-'
+
+
+def build_store(source_path, epsg, store_dir):
+    """解析并投影 GeoJSON，将结果写入缓存目录"""
+    import geopandas as gpd
+    import shapely
+
+    with tracing.span('read_geojson'):
+        gdf = gpd.read_file(source_path)
+    with tracing.span('to_crs', epsg=epsg):
+        gdf = gdf.to_crs(epsg=epsg)
+    geometry_type, coords, offsets = shapely.to_ragged_array(gdf.geometry.values)
+
+    # 先写入临时目录，完成后再整体改名，避免中断时留下不完整的缓存
+    tmp_dir = f"{store_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, 'coords.npy'), np.ascontiguousarray(coords))
+    for i, offset in enumerate(offsets):
+        np.save(os.path.join(tmp_dir, f'offsets_{i}.npy'), offset)
+
+    attributes = gdf.drop(columns=gdf.geometry.name)
+    meta = {
+        'version': STORE_VERSION,
+        'epsg': epsg,
+        'geometry_type': int(geometry_type),
+        'num_offsets': len(offsets),
+        'columns': attributes.columns.tolist(),
+        'attributes': json.loads(attributes.to_json(orient='split', index=False))['data'],
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    try:
+        os.replace(tmp_dir, store_dir)
+    except OSError:
+        # 其他进程已经生成了同一份缓存
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_store(store_dir):
+    """以内存映射方式读取缓存目录，返回投影后的 GeoDataFrame"""
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+
+    with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    coords = np.load(os.path.join(store_dir, 'coords.npy'), mmap_mode='r')
+    offsets = tuple(
+        np.load(os.path.join(store_dir, f'offsets_{i}.npy'), mmap_mode='r')
+        for i in range(meta['num_offsets'])
+    )
+    geometries = shapely.from_ragged_array(
+        shapely.GeometryType(meta['geometry_type']), coords, offsets)
+
+    attributes = pd.DataFrame(meta['attributes'], columns=meta['columns'])
+    return gpd.GeoDataFrame(attributes, geometry=geometries, crs=f"EPSG:{meta['epsg']}")
+
+
+def load_projected(source_path, epsg, cache_dir):
+    """
+    读取投影后的地理边界数据，优先使用二进制缓存
+
+    Parameters:
+    source_path: GeoJSON 源文件路径
+    epsg: 目标投影
+    cache_dir: 缓存根目录
+
+    Returns:
+    GeoDataFrame: 投影后的地理边界数据
+    """
+    store_root = os.path.join(cache_dir, 'geometry')
+    prefix = _store_prefix(source_path)
+    store_dir = os.path.join(store_root, prefix + source_hash(source_path, epsg)[:16])
+
+    if not os.path.exists(os.path.join(store_dir, 'meta.json')):
+        print(f"生成几何缓存：{store_dir}")
+        os.makedirs(store_root, exist_ok=True)
+        build_store(source_path, epsg, store_dir)
+
+        # 删除同一源文件的旧缓存
+        for name in os.listdir(store_root):
+            old_dir = os.path.join(store_root, name)
+            if name.startswith(prefix) and len(name) == len(prefix) + 16 and old_dir != store_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    return load_store(store_dir)
@@ -1,59 +1,450 @@
 # -*- coding: utf-8 -*-
+import io
+import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
 import warnings
 warnings.filterwarnings('ignore')
 
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
-
-def create_heatmap():
-    """创建各区客户流失率热力图"""
-    
-    # 读取数据
-    df = pd.read_csv('heat_map.csv', encoding='utf-8')
-    
-    # 处理流失率数据，直接使用数值（数据已经是数值格式）
-    df['流失率数值'] = df['客户流失率']
-    
-    # 将流失率转换为百分比格式用于显示
-    df['流失率百分比'] = df['客户流失率'] * 100
-    
-    # 创建透视表用于热力图
-    pivot_table = df.pivot(index='区名', columns='年份', values='流失率数值')
-    
-    # 创建用于标注的透视表
-    count_table = df.pivot(index='区名', columns='年份', values='累计客户流失数量')
-    rate_table = df.pivot(index='区名', columns='年份', values='流失率百分比')
-    
-    # 创建组合标注：数量 + 百分比
-    combined_annotations = np.empty_like(count_table, dtype=object)
-    for i in range(count_table.shape[0]):
-        for j in range(count_table.shape[1]):
-            count = count_table.iloc[i, j]
-            rate = rate_table.iloc[i, j]
-            if pd.isna(count) or pd.isna(rate):
-                combined_annotations[i, j] = ''
-            else:
-                combined_annotations[i, j] = f'{int(count)}\n{rate:.2f}%'
-    
-    # 设置图形大小
-    plt.figure(figsize=(30, 10))
-    
-    # 创建热力图
-    ax = sns.heatmap(
-        pivot_table,
-        annot=combined_annotations,
-        fmt='',
-        cmap='Oranges',
-        cbar_kws={'label': '客户流失率 (%)'},
-        linewidths=1,
-        linecolor='white',
-        annot_kws={'size': 20, 'weight': 'bold', 'ha': 'center', 'va': 'center'}
-    )
+import tracing
+
+# matplotlib、seaborn 只在绘制热力图时导入，生成分析报告不需要加载绘图库
+
+# 单元格数量超过该值时使用大矩阵模式（单个 pcolormesh 绘制，不再为每个单元格创建 seaborn 对象）
+LARGE_MATRIX_CELLS = 400
+
+# 大矩阵模式下每个单元格的期望尺寸（英寸）和图形尺寸上下限
+CELL_SIZE_INCHES = (1.2, 0.6)
+MIN_FIGURE_INCHES = (10, 6)
+MAX_FIGURE_INCHES = (60, 60)
+
+# 大矩阵模式输出图片的最大像素数，超过时自动降低 dpi
+MAX_HEATMAP_PIXELS = 40_000_000
+
+# 标注字号低于该值时降低细节：先只显示数量，仍然放不下时不显示标注
+MIN_ANNOTATION_FONTSIZE = 5
+
+# 有数据的单元格超过该数量时不显示标注：每个标注是一个文字对象，绘制耗时随单元格数线性增长，
+# 大图中单元格尺寸足够时字号检查不会关闭标注（600x48 的矩阵约 2.9 万个标注，绘制约 40 秒）
+MAX_ANNOTATED_CELLS = 3000
+
+# 统计结果缓存，键为 (文件路径, 修改时间, 文件大小)，数据文件变化后自动重新计算
+_stats_cache = {}
+
+def compute_churn_stats(df):
+    """
+    计算热力图和分析报告共用的统计结果
+
+    先按 (区名, 年份) 建立一次单元格表，透视表、极值和各年份/各区域平均值都由它派生
+
+    Parameters:
+    df: heat_map.csv 的数据
+
+    Returns:
+    dict: 统计结果
+        - pivot_table: 流失率透视表（行：区名，列：年份）
+        - count_table: 累计客户流失数量透视表
+        - rate_table: 流失率百分比透视表
+        - num_districts: 区域数量
+        - years: 排序后的年份列表
+        - min_rate / max_rate: 最低和最高流失率
+        - max_rate_cell: 最高流失率所在单元格 {'district', 'year', 'rate', 'count'}
+        - max_loss: 累计流失数量最多的记录 {'district', 'year', 'rate', 'count'}
+        - yearly_avg: 各年份平均流失率
+        - district_avg: 各区域平均流失率（从高到低）
+    """
+    # 与 DataFrame.pivot 相同：(区名, 年份) 重复时报错
+    cells = df.set_index(['区名', '年份'], verify_integrity=True)
+    pivot_table = cells['客户流失率'].unstack('年份')
+    count_table = cells['累计客户流失数量'].unstack('年份')
+    
+    # 最高流失率所在单元格
+    max_year = pivot_table.max().idxmax()
+    max_district = pivot_table[max_year].idxmax()
+    
+    # 累计流失数量最多的记录（取数据文件中第一次出现的记录）
+    max_loss_row = df.loc[df['累计客户流失数量'].idxmax()]
+    
+    return {
+        'pivot_table': pivot_table,
+        'count_table': count_table,
+        'rate_table': pivot_table * 100,
+        'num_districts': len(df['区名'].unique()),
+        'years': sorted(df['年份'].unique()),
+        'min_rate': pivot_table.min().min(),
+        'max_rate': pivot_table.max().max(),
+        'max_rate_cell': {
+            'district': max_district,
+            'year': max_year,
+            'rate': pivot_table.loc[max_district, max_year],
+            'count': count_table.loc[max_district, max_year],
+        },
+        'max_loss': {
+            'district': max_loss_row['区名'],
+            'year': int(max_loss_row['年份']),
+            'rate': max_loss_row['客户流失率'],
+            'count': int(max_loss_row['累计客户流失数量']),
+        },
+        'yearly_avg': pivot_table.mean(),
+        'district_avg': pivot_table.mean(axis=1).sort_values(ascending=False),
+    }
+
+def get_churn_stats(csv_path='heat_map.csv'):
+    """读取数据并计算统计结果；同一进程内数据文件未变化时直接使用缓存"""
+    stat = os.stat(csv_path)
+    key = (os.path.abspath(csv_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _stats_cache:
+        _stats_cache.clear()
+        with tracing.span('read_csv', path=csv_path):
+            df = pd.read_csv(csv_path, encoding='utf-8')
+        with tracing.span('churn_stats'):
+            _stats_cache[key] = compute_churn_stats(df)
+    return _stats_cache[key]
+
+# 数据文件超过该大小（字节）时分析报告自动使用分块流式统计
+STREAMING_THRESHOLD_BYTES = 200 * 1024 * 1024
+
+# 流式统计每次读取的行数
+STREAM_CHUNK_ROWS = 1_000_000
+
+def accumulate_chunk(chunk):
+    """统计一个数据块，返回可合并的累加器"""
+    names = chunk['区名']
+    years = chunk['年份']
+    rates = chunk['客户流失率']
+    counts = chunk['累计客户流失数量']
+    
+    # 累计流失数量最多的记录：(数量, 区名, 年份, 流失率)，并列时取第一次出现的记录
+    max_loss = None
+    if counts.notna().any():
+        row = counts.idxmax()
+        max_loss = (counts[row], names[row], years[row], rates[row])
+    
+    return {
+        'districts': set(names.dropna().unique().tolist()),
+        'missing_district': bool(names.isna().any()),
+        'years': set(years.dropna().unique().tolist()),
+        'min_rate': rates.min(),
+        'max_rate': rates.max(),
+        'max_loss': max_loss,
+        'year_sum': rates.groupby(years).sum(),
+        'year_count': rates.groupby(years).count(),
+        'district_sum': rates.groupby(names).sum(),
+        'district_count': rates.groupby(names).count(),
+    }
+
+def merge_accumulators(first, second):
+    """
+    合并两个累加器
+
+    second 中的记录在文件中必须位于 first 之后，最大流失数量并列时保留 first 中的记录
+    """
+    import numpy as np
+    
+    if first is None:
+        return second
+    if second is None:
+        return first
+    
+    max_loss = first['max_loss']
+    if max_loss is None or (second['max_loss'] is not None and second['max_loss'][0] > max_loss[0]):
+        max_loss = second['max_loss']
+    
+    return {
+        'districts': first['districts'] | second['districts'],
+        'missing_district': first['missing_district'] or second['missing_district'],
+        'years': first['years'] | second['years'],
+        'min_rate': np.fmin(first['min_rate'], second['min_rate']),
+        'max_rate': np.fmax(first['max_rate'], second['max_rate']),
+        'max_loss': max_loss,
+        'year_sum': first['year_sum'].add(second['year_sum'], fill_value=0),
+        'year_count': first['year_count'].add(second['year_count'], fill_value=0),
+        'district_sum': first['district_sum'].add(second['district_sum'], fill_value=0),
+        'district_count': first['district_count'].add(second['district_count'], fill_value=0),
+    }
+
+def finalize_accumulator(accumulator):
+    """由累加器计算分析报告需要的统计结果（与 compute_churn_stats 的对应字段一致）"""
+    count, district, year, rate = accumulator['max_loss']
+    district_avg = (accumulator['district_sum'] / accumulator['district_count']).sort_index()
+    yearly_avg = (accumulator['year_sum'] / accumulator['year_count']).sort_index()
+    yearly_avg.index = yearly_avg.index.astype(int)
+    
+    return {
+        'num_districts': len(accumulator['districts']) + int(accumulator['missing_district']),
+        'years': sorted(int(year) for year in accumulator['years']),
+        'min_rate': accumulator['min_rate'],
+        'max_rate': accumulator['max_rate'],
+        'max_loss': {
+            'district': district,
+            'year': int(year),
+            'rate': rate,
+            'count': int(count),
+        },
+        'yearly_avg': yearly_avg,
+        'district_avg': district_avg.sort_values(ascending=False),
+    }
+
+def _split_ranges(csv_path, parts):
+    """将数据文件（表头之后）按字节切分为若干段，每段都从行首开始"""
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        boundaries = [data_start]
+        for i in range(1, parts):
+            f.seek(max(data_start + (size - data_start) * i // parts, boundaries[-1]))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+class _RangeReader(io.RawIOBase):
+    """只读取文件中 [start, end) 字节范围的文件对象"""
+    
+    def __init__(self, path, start, end):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        data = self.file.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+    
+    def close(self):
+        self.file.close()
+        super().close()
+
+def _read_columns(csv_path):
+    """读取表头（兼容 UTF-8 BOM）"""
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        return pd.read_csv(f, nrows=0).columns.tolist()
+
+def accumulate_range(csv_path, start, end, chunksize=STREAM_CHUNK_ROWS):
+    """分块统计数据文件的一个字节范围，返回累加器"""
+    accumulator = None
+    with io.BufferedReader(_RangeReader(csv_path, start, end)) as reader:
+        for chunk in pd.read_csv(reader, header=None, names=_read_columns(csv_path),
+                                 encoding='utf-8', chunksize=chunksize):
+            accumulator = merge_accumulators(accumulator, accumulate_chunk(chunk))
+    return accumulator
+
+def stream_churn_stats(csv_path='heat_map.csv', chunksize=STREAM_CHUNK_ROWS, workers=1):
+    """
+    分块流式计算分析报告需要的统计结果
+
+    内存占用只与数据块大小和区域/年份数量有关，与数据行数无关。
+    workers 大于 1 时按行边界把文件切分为多段，由多个进程并行统计后合并。
+
+    Parameters:
+    csv_path: 数据文件路径
+    chunksize: 每次读取的行数
+    workers: 并行进程数
+
+    Returns:
+    dict: 与 compute_churn_stats 中分析报告所用字段一致的统计结果
+    """
+    ranges = _split_ranges(csv_path, max(1, workers))
+    if workers > 1 and len(ranges) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+            futures = [executor.submit(accumulate_range, csv_path, start, end, chunksize)
+                       for start, end in ranges]
+            accumulators = [future.result() for future in futures]
+    else:
+        accumulators = [accumulate_range(csv_path, start, end, chunksize) for start, end in ranges]
+    
+    # 按文件顺序合并各段结果
+    accumulator = None
+    for partial in accumulators:
+        accumulator = merge_accumulators(accumulator, partial)
+    if accumulator is None or accumulator['max_loss'] is None:
+        raise ValueError(f"数据文件中没有有效记录: {csv_path}")
+    return finalize_accumulator(accumulator)
+
+def build_annotations(count_table, rate_table, show_rate=True):
+    """
+    向量化生成单元格标注：数量 + 百分比（任一值缺失时为空字符串）
+
+    Parameters:
+    count_table: 流失数量透视表
+    rate_table: 流失率百分比透视表（与 count_table 行列一致）
+    show_rate: 为 False 时只标注数量
+
+    Returns:
+    numpy.ndarray: 与透视表形状相同的字符串数组
+    """
+    import numpy as np
+    
+    counts = count_table.to_numpy(dtype=float)
+    rates = rate_table.to_numpy(dtype=float)
+    missing = np.isnan(counts) | np.isnan(rates)
+    
+    count_text = np.char.mod('%d', np.trunc(np.where(missing, 0, counts)).astype(np.int64))
+    if show_rate:
+        rate_text = np.char.mod('%.2f%%', np.where(missing, 0, rates))
+        annotations = np.char.add(np.char.add(count_text, '\n'), rate_text)
+    else:
+        annotations = count_text
+    return np.where(missing, '', annotations).astype(object)
+
+def _relative_luminance(rgba):
+    """计算颜色的相对亮度，用于选择标注文字颜色"""
+    import numpy as np
+    
+    rgb = rgba[..., :3]
+    rgb = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return rgb @ np.array([0.2126, 0.7152, 0.0722])
+
+def _tick_step(count, max_ticks):
+    """刻度标签过多时每隔若干行/列显示一个"""
+    return max(1, -(-count // max_ticks))
+
+def draw_large_heatmap(pivot_table, count_table, rate_table):
+    """
+    大矩阵模式绘制热力图
+
+    - 所有单元格由一个 pcolormesh 绘制
+    - 图形尺寸随矩阵大小缩放（有上下限），dpi 随之降低以控制输出像素数
+    - 根据单元格实际尺寸自动选择标注细节：数量 + 百分比、只显示数量或不显示；
+      有数据的单元格超过 MAX_ANNOTATED_CELLS 时不显示标注
+
+    Returns:
+    tuple: (figure, 保存参数)
+    """
+    import matplotlib.pyplot as plt
+    import numpy as np
+    
+    rows, cols = pivot_table.shape
+    fig_width = min(max(cols * CELL_SIZE_INCHES[0] + 3, MIN_FIGURE_INCHES[0]), MAX_FIGURE_INCHES[0])
+    fig_height = min(max(rows * CELL_SIZE_INCHES[1] + 2, MIN_FIGURE_INCHES[1]), MAX_FIGURE_INCHES[1])
+    dpi = min(300, int((MAX_HEATMAP_PIXELS / (fig_width * fig_height)) ** 0.5))
+    
+    fig, ax = plt.subplots(figsize=(fig_width, fig_height))
+    
+    # 按刻度标签长度计算边距（英寸），中文字符按一个字号宽度估算
+    ytick_fontsize = min(14, max(4, (fig_height - 2) / rows * 72 * 0.8))
+    xtick_fontsize = 14 if cols <= 40 else 8
+    label_chars = max(len(str(name)) for name in pivot_table.index)
+    column_chars = max(len(str(name)) for name in pivot_table.columns)
+    left = (label_chars * ytick_fontsize + 40) / 72
+    bottom = ((column_chars * xtick_fontsize * 0.6 if cols > 40 else xtick_fontsize) + 40) / 72
+    fig.subplots_adjust(left=left / fig_width, right=1 - 1.2 / fig_width,
+                        bottom=bottom / fig_height, top=1 - 0.3 / fig_height)
+    
+    values = np.ma.masked_invalid(pivot_table.to_numpy(dtype=float))
+    
+    mesh = ax.pcolormesh(values, cmap='Oranges')
+    ax.set_xlim(0, cols)
+    ax.set_ylim(rows, 0)
+    # 色条固定约 0.4 英寸宽，不随图形尺寸放大
+    fig.colorbar(mesh, ax=ax, label='客户流失率 (%)',
+                 fraction=min(0.15, 0.4 / fig_width), pad=min(0.05, 0.3 / fig_width))
+    
+    # 单元格实际尺寸（磅）
+    position = ax.get_position()
+    cell_width = position.width * fig_width / cols * 72
+    cell_height = position.height * fig_height / rows * 72
+    
+    # 单元格足够大时保留白色分隔线（与小矩阵的 seaborn 样式一致）
+    if min(cell_width, cell_height) >= 12:
+        mesh.set_edgecolor('white')
+        mesh.set_linewidth(1)
+    
+    # 根据单元格尺寸选择标注细节
+    longest = max(len(f"{int(count_table.max().max())}"), 7) if count_table.size else 7
+    fontsize = min(20, cell_height / 2 / 1.3, cell_width / (longest * 0.65))
+    show_rate = True
+    if fontsize < MIN_ANNOTATION_FONTSIZE:
+        show_rate = False
+        fontsize = min(20, cell_height / 1.3, cell_width / (longest * 0.65))
+    
+    annotated_cells = int(values.count())
+    if annotated_cells > MAX_ANNOTATED_CELLS:
+        print(f"单元格过多（{annotated_cells} 个有数据的单元格，上限 {MAX_ANNOTATED_CELLS}），不显示单元格标注")
+    elif fontsize >= MIN_ANNOTATION_FONTSIZE:
+        annotations = build_annotations(count_table, rate_table, show_rate=show_rate)
+        face_colors = mesh.cmap(mesh.norm(values.filled(np.nan)))
+        text_colors = np.where(_relative_luminance(face_colors) > 0.408, 'black', 'white')
+        for i, j in zip(*np.nonzero(annotations != '')):
+            ax.text(j + 0.5, i + 0.5, annotations[i, j], fontsize=fontsize, fontweight='bold',
+                    ha='center', va='center', color=text_colors[i, j])
+    else:
+        print(f"单元格过小（{cell_width:.1f}x{cell_height:.1f} 磅），不显示单元格标注")
+    
+    # 刻度标签过密时间隔显示：行标签至少间隔 10 磅，列标签至少间隔 30 磅
+    row_step = _tick_step(rows, int(fig_height * 72 / 10))
+    col_step = _tick_step(cols, int(fig_width * 72 / 30))
+    ax.set_yticks(np.arange(0, rows, row_step) + 0.5)
+    ax.set_yticklabels(pivot_table.index[::row_step], fontsize=ytick_fontsize)
+    ax.set_xticks(np.arange(0, cols, col_step) + 0.5)
+    ax.set_xticklabels(pivot_table.columns[::col_step], fontsize=xtick_fontsize,
+                       rotation=0 if cols <= 40 else 90)
+    ax.tick_params(length=0)
+    
+    # 图形尺寸和边距已确定，保存时不使用 bbox_inches='tight'（它会额外完整绘制一遍所有标注）
+    return fig, {'dpi': dpi}
+
+def create_heatmap(large_matrix=None):
+    """
+    创建各区客户流失率热力图
+
+    Parameters:
+    large_matrix: 是否使用大矩阵模式；None 时单元格数量超过 LARGE_MATRIX_CELLS 自动启用
+    """
+    import matplotlib.pyplot as plt
+    
+    # 设置中文字体
+    plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
+    plt.rcParams['axes.unicode_minus'] = False
+    
+    # 读取数据并计算统计结果（与分析报告共用）
+    stats = get_churn_stats()
+    
+    # 透视表：流失率用于着色，数量和百分比用于标注
+    pivot_table = stats['pivot_table']
+    count_table = stats['count_table']
+    rate_table = stats['rate_table']
+    
+    if large_matrix is None:
+        large_matrix = pivot_table.size > LARGE_MATRIX_CELLS
+    
+    if large_matrix:
+        print(f"使用大矩阵模式绘制热力图（{pivot_table.shape[0]} 行 x {pivot_table.shape[1]} 列）")
+        with tracing.span('heatmap_draw', cells=int(pivot_table.size)):
+            fig, save_options = draw_large_heatmap(pivot_table, count_table, rate_table)
+    else:
+        import seaborn as sns
+        
+        # 创建组合标注：数量 + 百分比
+        combined_annotations = build_annotations(count_table, rate_table)
+        
+        # 设置图形大小
+        fig = plt.figure(figsize=(30, 10))
+        save_options = {'dpi': 300, 'bbox_inches': 'tight'}
+        
+        # 创建热力图
+        with tracing.span('heatmap_draw', cells=int(pivot_table.size)):
+            ax = sns.heatmap(
+                pivot_table,
+                annot=combined_annotations,
+                fmt='',
+                cmap='Oranges',
+                cbar_kws={'label': '客户流失率 (%)'},
+                linewidths=1,
+                linecolor='white',
+                annot_kws={'size': 20, 'weight': 'bold', 'ha': 'center', 'va': 'center'}
+            )
+        
+        # 调整坐标轴
+        plt.xticks(rotation=0, fontsize=14)
+        plt.yticks(rotation=0, fontsize=14)
     
     # 设置标题和标签
     #plt.title('各区客户流失率热力图 (2022-2025年)', 
@@ -61,108 +452,103 @@ def create_heatmap():
     plt.xlabel('年份', fontsize=16, fontweight='bold')
     plt.ylabel('区名', fontsize=16, fontweight='bold')
     
-    # 调整坐标轴
-    plt.xticks(rotation=0, fontsize=14)
-    plt.yticks(rotation=0, fontsize=14)
-    
     # 添加说明文字
     #plt.figtext(0.02, 0.02, 
     #            '说明：颜色越深表示流失率越高\n上行数字：客户流失数量\n下行数字：客户流失率', 
     #            fontsize=12, 
     #            bbox=dict(boxstyle="round,pad=0.5", facecolor="lightblue", alpha=0.7))
     
-    # 调整布局
-    plt.tight_layout()
+    # 调整布局（大矩阵模式已按尺寸计算好边距：tight_layout 会使保存时先额外完整绘制一遍所有标注）
+    if not large_matrix:
+        plt.tight_layout()
     
     # 保存图片
-    plt.savefig('customer_churn_heatmap.png', dpi=300, bbox_inches='tight', 
-                facecolor='white', edgecolor='none')
+    with tracing.span('heatmap_savefig'):
+        fig.savefig('customer_churn_heatmap.png', facecolor='white', edgecolor='none', **save_options)
     
     # 显示图片
     plt.show()
     
     # 将分析结果写入文件
-    with open('heatmap_analysis.txt', 'w', encoding='utf-8') as f:
+    write_heatmap_analysis(stats)
+    
+    return True
+
+def write_heatmap_analysis(stats, path='heatmap_analysis.txt'):
+    """将热力图统计结果写入文件"""
+    pivot_table = stats['pivot_table']
+    max_cell = stats['max_rate_cell']
+    
+    with open(path, 'w', encoding='utf-8') as f:
         f.write("各区客户流失率热力图分析报告\n")
         f.write("="*60 + "\n\n")
         
         f.write(f"统计区域数量：{len(pivot_table)} 个区\n")
         f.write(f"年份范围：{pivot_table.columns.min()} - {pivot_table.columns.max()}\n")
-        f.write(f"流失率范围：{pivot_table.min().min():.2f}% - {pivot_table.max().max():.2f}%\n\n")
-        
-        # 找到最高流失率的位置
-        max_rate = pivot_table.max().max()  
-        max_year = pivot_table.max().idxmax()
-        max_district = pivot_table[max_year].idxmax()
-        max_count = count_table.loc[max_district, max_year]
+        f.write(f"流失率范围：{stats['min_rate']:.2f}% - {stats['max_rate']:.2f}%\n\n")
         
-        f.write(f"最高流失率：{max_rate:.2f}%\n")
-        f.write(f"最高流失率位置：{max_district} ({max_year}年)\n")
-        f.write(f"对应流失数量：{max_count} 人\n\n")
+        f.write(f"最高流失率：{max_cell['rate']:.2f}%\n")
+        f.write(f"最高流失率位置：{max_cell['district']} ({max_cell['year']}年)\n")
+        f.write(f"对应流失数量：{max_cell['count']} 人\n\n")
         
         f.write("各年份平均流失率：\n")
-        yearly_avg = pivot_table.mean()
-        for year, rate in yearly_avg.items():
+        for year, rate in stats['yearly_avg'].items():
             f.write(f"  {year}年：{rate:.2f}%\n")
         
         f.write("\n各区域平均流失率（从高到低）：\n")
-        district_avg = pivot_table.mean(axis=1).sort_values(ascending=False)
-        for district, rate in district_avg.items():
+        for district, rate in stats['district_avg'].items():
             f.write(f"  {district}：{rate:.2f}%\n")
-    
-    return True
 
-def generate_analysis_report():
-    """生成各区客户流失率热力图分析报告"""
-    try:
-        # 读取数据
-        df = pd.read_csv('heat_map.csv', encoding='utf-8')
-        
-        # 基本统计信息
-        total_regions = len(df['区名'].unique())
-        years = sorted(df['年份'].unique())
-        year_range = f"{min(years)} - {max(years)}"
-        
-        # 计算流失率范围（转换为百分比）
-        min_rate = df['客户流失率'].min() * 100
-        max_rate = df['客户流失率'].max() * 100
-        
-        # 找到最高流失数量地区
-        max_loss_row = df.loc[df['累计客户流失数量'].idxmax()]
-        max_loss_region = max_loss_row['区名']
-        max_loss_year = int(max_loss_row['年份'])
-        max_loss_rate = max_loss_row['客户流失率'] * 100
-        max_loss_count = int(max_loss_row['累计客户流失数量'])
-        
-        # 计算各年份平均流失率
-        yearly_avg = df.groupby('年份')['客户流失率'].mean() * 100
-        
-        # 计算各区域平均流失率（从高到低）
-        regional_avg = df.groupby('区名')['客户流失率'].mean() * 100
-        regional_avg_sorted = regional_avg.sort_values(ascending=False)
-        
-        # 生成报告
-        report = f"""各区客户流失率热力图分析报告
+def format_analysis_report(stats):
+    """按标准模板生成分析报告文本"""
+    max_loss = stats['max_loss']
+    yearly_avg = stats['yearly_avg'] * 100
+    years = stats['years']
+    
+    report = f"""各区客户流失率热力图分析报告
 ============================================================
 
-统计区域数量：{total_regions} 个区
-年份范围：{year_range}
-流失率范围：{min_rate:.2f}% - {max_rate:.2f}%
+统计区域数量：{stats['num_districts']} 个区
+年份范围：{min(years)} - {max(years)}
+流失率范围：{stats['min_rate'] * 100:.2f}% - {stats['max_rate'] * 100:.2f}%
 
-最高流失数量地区：{max_loss_region}（{max_loss_year}年）
-流失率：{max_loss_rate:.2f}%
-对应流失数量：{max_loss_count} 人
+最高流失数量地区：{max_loss['district']}（{max_loss['year']}年）
+流失率：{max_loss['rate'] * 100:.2f}%
+对应流失数量：{max_loss['count']} 人
 
 各年份平均流失率："""
 
-        for year in sorted(yearly_avg.index):
-            report += f"\n  {int(year)}年：{yearly_avg[year]:.2f}%"
+    for year in sorted(yearly_avg.index):
+        report += f"\n  {int(year)}年：{yearly_avg[year]:.2f}%"
 
-        report += "\n\n各区域平均流失率（从高到低）："
-        for region, rate in regional_avg_sorted.items():
-            report += f"\n {region}：{rate:.2f}%"
+    report += "\n\n各区域平均流失率（从高到低）："
+    for region, rate in (stats['district_avg'] * 100).items():
+        report += f"\n {region}：{rate:.2f}%"
+    
+    report += "\n" + "="*60 + "\n"
+    return report
+
+def generate_analysis_report(streaming=None, workers=1):
+    """
+    生成各区客户流失率热力图分析报告
+
+    Parameters:
+    streaming: 是否分块流式统计；None 时数据文件超过 STREAMING_THRESHOLD_BYTES 自动启用
+    workers: 流式统计的并行进程数
+    """
+    try:
+        csv_path = 'heat_map.csv'
+        if streaming is None:
+            streaming = os.path.getsize(csv_path) > STREAMING_THRESHOLD_BYTES
         
-        report += "\n" + "="*60 + "\n"
+        if streaming:
+            # 分块流式统计，内存占用与数据行数无关
+            with tracing.span('stream_stats', workers=workers):
+                stats = stream_churn_stats(csv_path, workers=workers)
+        else:
+            # 读取数据并计算统计结果（与热力图共用，同一进程内只计算一次）
+            stats = get_churn_stats(csv_path)
+        report = format_analysis_report(stats)
         
         # 保存报告到文件
         with open('流失率分析报告.txt', 'w', encoding='utf-8') as f:
@@ -182,6 +568,17 @@ def generate_analysis_report():
         print(f"Error generating analysis report: {str(e)}")
         return False
 
+def create_heatmap_and_report(streaming=None):
+    """
+    在同一进程中依次生成热力图和分析报告，两者共用一次统计结果
+
+    Parameters:
+    streaming: 传给 generate_analysis_report
+    """
+    heatmap_success = create_heatmap()
+    report_success = generate_analysis_report(streaming)
+    return heatmap_success and report_success
+
 if __name__ == "__main__":
     success = create_heatmap()
     if success:
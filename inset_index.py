@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+区域内缩距离索引
+
+为每个区域预先计算 "内缩距离 -> 面积比例" 的单调曲线并保存到磁盘，
+之后任意目标比例只需查表插值再加一两次 buffer 校正即可得到内缩距离。
+索引以几何体哈希为键，map.geojson 变化后对应条目自动失效，
+不再使用的旧条目由 prune_index 删除。
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import shapely
+
+import tracing
+
+# 索引格式版本，buffer 参数或曲线采样方式变化时需要递增
+INDEX_VERSION = 2
+
+# 每条曲线的采样点数
+NUM_SAMPLES = 64
+
+# 默认最大内缩距离（米），与原二分法的搜索范围一致
+MAX_INSET = 50000
+
+
+def geometry_hash(geom):
+    """计算几何体的哈希值，作为索引键"""
+    digest = hashlib.sha1()
+    digest.update(f"inset-v{INDEX_VERSION}".encode('utf-8'))
+    digest.update(shapely.to_wkb(geom))
+    return digest.hexdigest()
+
+
+def load_index(path):
+    """从磁盘读取索引，文件不存在或版本不匹配时返回空索引"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION:
+                index['dirty'] = False
+                return index
+        except (OSError, ValueError) as e:
+            print(f"读取内缩索引失败，将重新生成: {e}")
+    return {'version': INDEX_VERSION, 'entries': {}, 'dirty': False}
+
+
+def save_index(index, path):
+    """将索引写回磁盘（先写临时文件再替换，避免写入中断导致文件损坏）"""
+    if not index.get('dirty'):
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    data = {'version': index['version'], 'entries': index['entries']}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    index['dirty'] = False
+
+
+def prune_index(index, geoms):
+    """
+    删除不属于给定几何体的曲线
+
+    曲线以几何体哈希为键，边界数据或简化参数变化后旧条目不会再被使用，
+    保存前删除它们，避免索引文件随每次变化不断增大
+
+    Returns:
+    int: 删除的条目数
+    """
+    keep = {geometry_hash(geom) for geom in geoms}
+    stale = [key for key in index['entries'] if key not in keep]
+    for key in stale:
+        del index['entries'][key]
+    if stale:
+        index['dirty'] = True
+    return len(stale)
+
+
+def _find_collapse_distance(geom, max_inset=MAX_INSET, iterations=40):
+    """二分查找使几何体内缩为空的最小内缩距离（返回正数）"""
+    low, high = 0.0, float(max_inset)
+    tracing.count('buffer')
+    if not geom.buffer(-high).is_empty:
+        return high
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        tracing.count('buffer')
+        if geom.buffer(-mid).is_empty:
+            high = mid
+        else:
+            low = mid
+    return high
+
+
+def build_curve(geom, num_samples=NUM_SAMPLES):
+    """
+    计算区域的 内缩距离 -> 面积比例 曲线
+
+    Returns:
+    dict: distances（从 0 递减到坍缩距离的负数）和对应的 ratios（从 1 递减到 0）
+    """
+    original_area = geom.area
+    collapse = _find_collapse_distance(geom)
+    distances = -np.linspace(0.0, collapse, num_samples + 1)
+    # 一次向量化 buffer 调用完成所有采样，参数与求解时相同（shapely.buffer 默认 quad_segs=8）
+    tracing.count('buffer', len(distances))
+    areas = shapely.area(shapely.buffer(geom, distances, quad_segs=16))
+    ratios = areas / original_area if original_area > 0 else np.zeros_like(areas)
+    # 数值误差可能破坏单调性，这里强制单调递减
+    ratios = np.minimum.accumulate(ratios)
+    return {'distances': distances.tolist(), 'ratios': ratios.tolist()}
+
+
+def get_curve(index, geom):
+    """从索引中获取区域曲线，不存在时计算并加入索引"""
+    key = geometry_hash(geom)
+    curve = index['entries'].get(key)
+    if curve is None:
+        curve = build_curve(geom)
+        index['entries'][key] = curve
+        index['dirty'] = True
+    return curve
+
+
+def solve_insets(geoms, target_ratios, curves, tolerance=0.01, max_iterations=50):
+    """
+    批量求解多个区域达到目标面积比例的内缩距离
+
+    先在各区域的曲线上找到包含目标比例的区间并线性插值，再用试位法（regula falsi）
+    校正，通常一到两次 buffer 即可落在容差内。每一步用一次 shapely 数组调用对所有
+    尚未收敛的区域按各自的距离做 buffer，已收敛的区域不再参与后续迭代
+
+    Parameters:
+    geoms: 区域几何体数组
+    target_ratios: 各区域的目标面积比例
+    curves: 各区域的 build_curve 曲线
+    tolerance: 面积比例误差容忍度
+    max_iterations: 最多迭代次数
+
+    Returns:
+    tuple: (内缩距离数组, 内缩后的几何体数组, 各区域的 buffer 次数数组)，
+           找不到非空结果的几何体为空
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    target_ratios = np.asarray(target_ratios, dtype=np.float64)
+    count = len(geoms)
+    original_areas = shapely.area(geoms)
+    best_distances = np.zeros(count)
+    best_geoms = np.full(count, None, dtype=object)
+    high_d, high_r, low_d, low_r = (np.zeros(count) for _ in range(4))
+    active = np.ones(count, dtype=bool)
+    buffer_counts = np.zeros(count, dtype=np.int64)
+
+    for j, curve in enumerate(curves):
+        ratios = curve['ratios']
+        # 目标比例不小于原始比例时不需要内缩
+        if target_ratios[j] >= ratios[0]:
+            active[j] = False
+            continue
+        # 在曲线上找到包含目标比例的区间：high 一侧比例偏大（内缩较少），low 一侧偏小
+        k = int(np.searchsorted(-np.asarray(ratios), -target_ratios[j], side='left'))
+        k = min(max(k, 1), len(ratios) - 1)
+        high_d[j], high_r[j] = curve['distances'][k - 1], ratios[k - 1]
+        low_d[j], low_r[j] = curve['distances'][k], ratios[k]
+
+    unchanged = ~active
+    if unchanged.any():
+        tracing.count('buffer', int(unchanged.sum()))
+        buffer_counts[unchanged] += 1
+        best_geoms[unchanged] = shapely.buffer(geoms[unchanged], 0.0, quad_segs=16)
+
+    for i in range(max_iterations):
+        index = np.flatnonzero(active)
+        if len(index) == 0:
+            break
+        h_d, h_r, l_d, l_r = high_d[index], high_r[index], low_d[index], low_r[index]
+        target = target_ratios[index]
+
+        # 试位法插值，插值点贴近区间端点时改用二分，保证收敛
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mid_d = np.where(h_r > l_r, h_d + (target - h_r) * (l_d - h_d) / (l_r - h_r), (h_d + l_d) / 2)
+        span = h_d - l_d
+        bisect = ~((l_d + 0.01 * span < mid_d) & (mid_d < h_d - 0.01 * span))
+        if i >= 3:
+            bisect[:] = True
+        mid_d = np.where(bisect, (h_d + l_d) / 2, mid_d)
+
+        # 与 Geometry.buffer 的默认参数相同（shapely.buffer 默认 quad_segs=8）
+        buffered = shapely.buffer(geoms[index], mid_d, quad_segs=16)
+        tracing.count('buffer', len(index))
+        buffer_counts[index] += 1
+        empty = shapely.is_empty(buffered)
+        area_ratio = np.where(empty, 0.0, shapely.area(buffered) / original_areas[index])
+
+        # 结果为空：只收紧 low 一侧，不记录为最佳结果
+        low_d[index[empty]] = mid_d[empty]
+        low_r[index[empty]] = 0.0
+
+        found = ~empty
+        best_distances[index[found]] = mid_d[found]
+        best_geoms[index[found]] = buffered[found]
+        converged = found & (np.abs(area_ratio - target) < tolerance)
+        too_large = found & ~converged & (area_ratio > target)
+        too_small = found & ~converged & (area_ratio <= target)
+        high_d[index[too_large]], high_r[index[too_large]] = mid_d[too_large], area_ratio[too_large]
+        low_d[index[too_small]], low_r[index[too_small]] = mid_d[too_small], area_ratio[too_small]
+        active[index[converged]] = False
+
+    missing = np.array([geom is None for geom in best_geoms], dtype=bool)
+    if missing.any():
+        best_geoms[missing] = shapely.Polygon()
+    return best_distances, best_geoms, buffer_counts
+
+
+def interpolate_distance(curve, target_ratio):
+    """
+    直接在曲线上线性插值得到内缩距离，不做 buffer 校正
+
+    精度取决于曲线采样密度，用于平滑动画的中间帧等不要求精确面积、但需要大量查询的场合
+
+    Returns:
+    float: 内缩距离（非正数）
+    """
+    ratios = np.asarray(curve['ratios'])
+    distances = np.asarray(curve['distances'])
+    if target_ratio >= ratios[0]:
+        return 0.0
+    # np.interp 要求横坐标递增，曲线按比例递减存储，这里反转
+    return float(np.interp(target_ratio, ratios[::-1], distances[::-1]))
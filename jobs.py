@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal dependency-graph job runner
+
+A job graph is a dict mapping job name to a job dict:
+    {'func': callable, 'args': tuple, 'deps': [job names]}
+Jobs run as soon as all their dependencies succeeded. A job fails when it
+raises or returns False/None; jobs depending on a failed job are skipped.
+When tracing is enabled, each job runs inside a 'job' span and the trace
+events recorded in worker processes are merged back into this process.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import tracing
+
+
+def make_job(func, *args, deps=()):
+    """Create a job entry for run_job_graph"""
+    return {'func': func, 'args': args, 'deps': list(deps)}
+
+
+def _run_job(func, args):
+    """Run one job and return (success, elapsed seconds, error message)"""
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+        success = result is not None and result is not False
+        error = None if success else 'job reported failure'
+    except Exception as e:
+        success = False
+        error = f"{type(e).__name__}: {e}"
+    return success, time.perf_counter() - start, error
+
+
+def _run_traced_job(name, func, args):
+    """Run one job inside a trace span, return (job result tuple, trace events)"""
+    def traced():
+        with tracing.span('job', job=name):
+            return _run_job(func, args)
+    return tracing.collect(traced)
+
+
+def _check_graph(jobs):
+    """Validate dependencies and reject cycles"""
+    for name, job in jobs.items():
+        for dep in job['deps']:
+            if dep not in jobs:
+                raise ValueError(f"Job '{name}' depends on unknown job '{dep}'")
+
+    visiting, visited = set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle detected at job '{name}'")
+        visiting.add(name)
+        for dep in jobs[name]['deps']:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+
+    for name in jobs:
+        visit(name)
+
+
+def run_job_graph(jobs, workers=1):
+    """
+    Run a job graph, executing independent jobs concurrently
+
+    Parameters:
+    jobs: dict of job name -> job dict (see make_job)
+    workers: number of worker processes; 1 runs every job in this process
+
+    Returns:
+    dict: job name -> {'status': 'ok' | 'failed' | 'skipped', 'elapsed': seconds, 'error': str or None}
+    """
+    _check_graph(jobs)
+
+    results = {}
+    pending = dict(jobs)
+
+    def ready_jobs():
+        """Jobs whose dependencies all succeeded; skipping propagates transitively"""
+        changed = True
+        while changed:
+            changed = False
+            ready = []
+            for name, job in list(pending.items()):
+                dep_status = [results[dep]['status'] for dep in job['deps'] if dep in results]
+                if any(status != 'ok' for status in dep_status):
+                    results[name] = {'status': 'skipped', 'elapsed': 0.0, 'error': 'dependency failed'}
+                    print(f"[skip] {name} (dependency failed)")
+                    del pending[name]
+                    changed = True
+                elif len(dep_status) == len(job['deps']):
+                    ready.append(name)
+        return ready
+
+    def record(name, outcome, events=()):
+        success, elapsed, error = outcome
+        tracing.merge(events)
+        results[name] = {'status': 'ok' if success else 'failed', 'elapsed': elapsed, 'error': error}
+        if success:
+            print(f"[done] {name} ({elapsed:.1f}s)")
+        else:
+            print(f"[fail] {name} ({elapsed:.1f}s): {error}")
+
+    if workers <= 1:
+        while pending:
+            ready = ready_jobs()
+            if not ready:
+                break
+            for name in ready:
+                job = pending.pop(name)
+                print(f"[start] {name}")
+                record(name, *_run_traced_job(name, job['func'], job['args']))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            for name in ready_jobs():
+                job = pending.pop(name)
+                print(f"[start] {name}")
+                running[executor.submit(_run_traced_job, name, job['func'], job['args'])] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    record(name, *future.result())
+                except Exception as e:
+                    # The worker process itself died (e.g. killed or out of memory)
+                    record(name, (False, 0.0, f"{type(e).__name__}: {e}"))
+
+    return results
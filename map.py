@@ -1,47 +1,185 @@
 # -*- coding: utf-8 -*-
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from matplotlib.cm import get_cmap
 import pandas as pd
 import numpy as np
-from shapely.geometry import Polygon
-from shapely.affinity import scale
-from PIL import Image
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import tracing
+
+# geopandas、matplotlib、shapely、PIL 等重量级库只在真正需要时才导入，
+# 使 import map 不读取任何数据文件，config.py 等入口可以快速启动
 
 # 设置输出编码
 if sys.platform == 'win32':
     import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']  # 支持中文显示
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+# 输出目录
+output_dir = "map_outputs"
+
+# 增量构建清单：记录每个输出文件的输入哈希
+manifest_path = os.path.join(output_dir, "manifest.json")
 
-# 读取地理边界数据
-gdf = gpd.read_file("map.geojson")
+# 渲染参数，参与增量构建的输入哈希；绘图代码改变输出效果时需要递增 version
+render_settings = {
+    'version': 3,
+    'figsize': (12, 10),
+    'dpi': 300,
+    'gradient_layers': 8,
+    'inset_tolerance': 0.01,
+    # 几何简化容差（输出像素数），0 表示不简化；可通过环境变量 MAP_SIMPLIFY_PIXELS 设置，
+    # 使用环境变量是为了让多进程渲染的子进程得到相同的设置
+    'simplify_pixels': float(os.environ.get('MAP_SIMPLIFY_PIXELS', 0)),
+    # 渲染后端：'vector'（矢量 buffer 渐变）或 'raster'（栅格距离变换渐变），可通过环境变量 MAP_RENDERER 设置
+    'renderer': os.environ.get('MAP_RENDERER', 'vector'),
+    # 地图帧输出格式：'png'、'png-palette'（256 色调色板）或 'webp'，可通过环境变量 MAP_OUTPUT_FORMAT 设置
+    'output_format': os.environ.get('MAP_OUTPUT_FORMAT', 'png'),
+    # PNG 压缩级别（0-9），可通过环境变量 MAP_PNG_COMPRESS 设置
+    'compress_level': int(os.environ.get('MAP_PNG_COMPRESS', 6)),
+}
 
-# 读取比例数据
-ratio_df = pd.read_csv("shrink_ratio.csv")
+# 动画每帧持续时间（毫秒）
+animation_duration = 1000
 
-# 读取客户数量数据
-customer_df = pd.read_csv("customer_num.csv")
+# 平滑动画默认参数：帧率、相邻年份之间的过渡时长（秒）、每个年份的停留时长（秒）、分辨率
+smooth_animation_settings = {
+    'fps': 24,
+    'transition': 1.5,
+    'hold': 0.5,
+    'dpi': 100,
+}
 
-# 投影为米制坐标（方便做面积计算）
-gdf = gdf.to_crs(epsg=32650)
+# 瓦片金字塔默认缩放级别范围（含两端）；10 级瓦片的分辨率与 300dpi 整图相近
+tile_zooms = (6, 10)
 
-# 获取年份列表
-years = ratio_df.columns[1:].tolist()  # 跳过第一列的district列
-print(f"发现年份数据：{years}")
-print(f"将生成 {len(years)} 张地图")
+# 区域底色和边框颜色（RGBA）：空白区域白色、黑色边框；有数据区域蓝色半透明、半透明边框
+BLANK_FACE = (1.0, 1.0, 1.0, 1.0)
+MATCHED_FACE = (0x1E / 255, 0x90 / 255, 0xFF / 255, 0.4)
+BLANK_EDGE = (0.0, 0.0, 0.0, 1.0)
+MATCHED_EDGE = (0.0, 0.0, 0.0, 0.4)
 
-# 创建输出目录
-output_dir = "map_outputs"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-    print(f"创建输出目录：{output_dir}")
+# 缓存目录（几何缓存、内缩索引等可重建的中间结果）
+cache_dir = "map_cache"
+
+# 已加载数据的缓存（地理边界、比例数据、客户数量数据）
+_data_cache = {}
+
+def get_pyplot():
+    """导入 matplotlib.pyplot 并设置中文字体（只设置一次）"""
+    import matplotlib.pyplot as plt
+    if 'pyplot' not in _data_cache:
+        # 设置中文字体
+        plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']  # 支持中文显示
+        plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        _data_cache['pyplot'] = True
+    return plt
+
+def get_gdf():
+    """读取地理边界数据并投影为米制坐标（首次调用时加载，之后使用缓存）"""
+    if 'gdf' not in _data_cache:
+        import geometry_store
+        
+        # 读取投影后的地理边界数据，优先使用预投影的二进制几何缓存
+        with tracing.span('load_geometry'):
+            try:
+                gdf = geometry_store.load_projected("map.geojson", 32650, cache_dir)
+            except Exception as e:
+                import geopandas as gpd
+                print(f"读取几何缓存失败，直接解析GeoJSON: {e}")
+                
+                # 读取地理边界数据，投影为米制坐标（方便做面积计算）
+                gdf = gpd.read_file("map.geojson")
+                with tracing.span('to_crs', epsg=32650):
+                    gdf = gdf.to_crs(epsg=32650)
+        _data_cache['gdf'] = gdf
+    return _data_cache['gdf']
+
+def get_pixel_size(gdf):
+    """
+    估算输出图片中每像素对应的米数
+
+    按整个画布估算，实际坐标轴区域更小，因此估算值偏小（偏保守）
+    """
+    min_x, min_y, max_x, max_y = gdf.total_bounds
+    width, height = render_settings['figsize']
+    dpi = render_settings['dpi']
+    return max((max_x - min_x) / (width * dpi), (max_y - min_y) / (height * dpi))
+
+def get_simplify_tolerance(gdf):
+    """根据输出尺寸和分辨率计算几何简化容差（米）"""
+    return get_pixel_size(gdf) * render_settings['simplify_pixels']
+
+def get_render_gdf():
+    """
+    获取用于计算和绘图的地理边界数据
+
+    开启简化时对所有区域做覆盖简化（coverage simplification）：相邻区域的公共边界
+    只简化一次，简化后仍然严丝合缝，不会出现缝隙或重叠。未开启时直接返回原始数据。
+    """
+    if 'render_gdf' not in _data_cache:
+        gdf = get_gdf()
+        if render_settings['simplify_pixels'] > 0:
+            import shapely
+            
+            tolerance = get_simplify_tolerance(gdf)
+            original = gdf.geometry.values
+            try:
+                with tracing.span('simplify'):
+                    simplified = shapely.coverage_simplify(original, tolerance)
+            except (AttributeError, shapely.errors.UnsupportedGEOSVersionError) as e:
+                # 覆盖简化需要 shapely 2.1 / GEOS 3.12 以上版本
+                print(f"当前 shapely/GEOS 版本不支持覆盖简化，使用原始几何体: {e}")
+                simplified = None
+            
+            if simplified is not None:
+                area_change = np.abs(shapely.area(simplified) / shapely.area(original) - 1)
+                print(f"几何简化：容差 {tolerance:.1f} 米，"
+                      f"顶点数 {shapely.get_num_coordinates(original).sum()} -> "
+                      f"{shapely.get_num_coordinates(simplified).sum()}，"
+                      f"最大面积变化 {area_change.max() * 100:.3f}%")
+                gdf = gdf.set_geometry(simplified)
+        _data_cache['render_gdf'] = gdf
+    return _data_cache['render_gdf']
+
+def get_ratio_df():
+    """读取比例数据（首次调用时加载，之后使用缓存）"""
+    if 'ratio_df' not in _data_cache:
+        _data_cache['ratio_df'] = pd.read_csv("shrink_ratio.csv")
+    return _data_cache['ratio_df']
+
+def get_customer_df():
+    """读取客户数量数据（首次调用时加载，之后使用缓存）"""
+    if 'customer_df' not in _data_cache:
+        _data_cache['customer_df'] = pd.read_csv("customer_num.csv")
+    return _data_cache['customer_df']
+
+def get_years():
+    """获取年份列表"""
+    return get_ratio_df().columns[1:].tolist()  # 跳过第一列的district列
+
+def __getattr__(name):
+    """兼容旧代码中的 map.gdf、map.ratio_df、map.customer_df、map.years 访问方式"""
+    accessors = {
+        'gdf': get_gdf,
+        'ratio_df': get_ratio_df,
+        'customer_df': get_customer_df,
+        'years': get_years,
+    }
+    if name in accessors:
+        return accessors[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+inset_index_path = os.path.join(cache_dir, "inset_index.json")
+_inset_index = None
+
+def get_inset_index():
+    """获取内缩距离索引（首次调用时从磁盘加载）"""
+    global _inset_index
+    import inset_index
+    if _inset_index is None:
+        _inset_index = inset_index.load_index(inset_index_path)
+    return _inset_index
 
 def calculate_color_by_customer_num(customer_num, min_num, max_num):
     """根据客户数量计算颜色，从亮黄色到深红色，使用非线性映射增强对比度"""
@@ -68,85 +206,171 @@ def calculate_color_by_customer_num(customer_num, min_num, max_num):
     
     return color
 
-def create_gradient_layers(orange_geom, blue_geom, base_color, num_layers=10):
-    """创建橙色渐变层"""
-    layers = []
+def geometry_to_path(geom):
+    """将 Polygon/MultiPolygon 转换为一个 matplotlib 复合路径（包含内环）"""
+    from matplotlib.path import Path
+    
+    polygons = getattr(geom, 'geoms', [geom])
+    rings = []
+    for polygon in polygons:
+        if polygon.is_empty or polygon.geom_type != 'Polygon':
+            continue
+        rings.append(Path(np.asarray(polygon.exterior.coords)[:, :2], closed=True))
+        for interior in polygon.interiors:
+            rings.append(Path(np.asarray(interior.coords)[:, :2], closed=True))
+    if not rings:
+        return None
+    return Path.make_compound_path(*rings)
+
+def draw_polygon_collection(ax, geoms, facecolors, edgecolors='none', linewidth=0):
+    """
+    将多个多边形合并为一个 PathCollection 绘制，每个面使用各自的 RGBA 颜色
+
+    Parameters:
+    ax: matplotlib 坐标轴
+    geoms: 几何体列表
+    facecolors: 每个几何体的 RGBA 填充色
+    edgecolors: 每个几何体的 RGBA 边框色，或 'none'
+    linewidth: 边框宽度
+
+    Returns:
+    PathCollection 或 None（没有可绘制的几何体时）
+    """
+    from matplotlib.collections import PathCollection
+    
+    paths = []
+    face_rgba = []
+    edge_rgba = []
+    for i, geom in enumerate(geoms):
+        path = geometry_to_path(geom)
+        if path is None:
+            continue
+        paths.append(path)
+        face_rgba.append(facecolors[i])
+        if not isinstance(edgecolors, str):
+            edge_rgba.append(edgecolors[i])
+    
+    if not paths:
+        return None
+    
+    collection = PathCollection(
+        paths,
+        facecolors=face_rgba,
+        edgecolors=edge_rgba if edge_rgba else edgecolors,
+        linewidths=linewidth,
+    )
+    ax.add_collection(collection, autolim=True)
+    return collection
+
+def create_gradient_layers_batch(orange_geoms, blue_geoms, base_colors, districts, num_layers=10):
+    """
+    批量创建所有区域的橙色渐变层
+
+    所有区域、所有层的 buffer、求交和求差各用一次 shapely 数组调用完成：
+    第 i 层累积区域为核心向外扩展 (i+1)/num_layers 倍最大距离后与区域求交，
+    本层圆环为累积区域减去上一层被采用的累积区域（都未采用时为核心）
+
+    Parameters:
+    orange_geoms: 各区域的橙色核心
+    blue_geoms: 各区域的几何体
+    base_colors: 各区域的橙色
+    districts: 各区域名称（记录到每一层的 'district'）
+    num_layers: 层数
+
+    Returns:
+    list: 按区域、由内到外排列的渐变层字典
+    """
+    import shapely
+    
+    orange_geoms = np.asarray(orange_geoms, dtype=object)
+    blue_geoms = np.asarray(blue_geoms, dtype=object)
+    if len(orange_geoms) == 0:
+        return []
     
-    if orange_geom.is_empty or blue_geom.is_empty:
-        return layers
+    # 计算橙色区域边界到蓝色区域边界的距离，没有空间扩展的区域不生成渐变
+    valid = ~(shapely.is_empty(orange_geoms) | shapely.is_empty(blue_geoms))
+    max_distances = np.zeros(len(orange_geoms))
+    max_distances[valid] = shapely.distance(shapely.boundary(orange_geoms[valid]),
+                                            shapely.boundary(blue_geoms[valid]))
+    districts_index = np.flatnonzero(valid & (max_distances > 0))
+    if len(districts_index) == 0:
+        return []
+    
+    # (区域, 层) 展平为一维数组
+    steps = np.arange(1, num_layers + 1)
+    orange = np.repeat(orange_geoms[districts_index], num_layers)
+    blue = np.repeat(blue_geoms[districts_index], num_layers)
+    distances = (max_distances[districts_index][:, None] * steps / num_layers).ravel()
     
-    # 计算橙色区域到蓝色区域边界的最大距离
     try:
-        # 获取橙色区域的边界
-        orange_boundary = orange_geom.boundary
-        blue_boundary = blue_geom.boundary
-        
-        # 计算橙色区域边界到蓝色区域边界的距离
-        max_distance = orange_boundary.distance(blue_boundary)
+        # 与 Geometry.buffer 的默认参数相同（shapely.buffer 默认 quad_segs=8）
+        expanded = shapely.buffer(orange, distances, quad_segs=16)
+        tracing.count('buffer', len(expanded))
+        # 确保在蓝色区域内（完全包含时跳过求交）
+        shapely.prepare(blue)
+        inside = shapely.contains(blue, expanded)
+        cumulative = expanded.copy()
+        cumulative[~inside] = shapely.intersection(expanded[~inside], blue[~inside])
         
-        if max_distance <= 0:
-            return layers
+        # 累积区域为空或面积不超过核心的层不采用；被采用的累积区域作为下一层的"上一层"
+        accepted = ~shapely.is_empty(cumulative) & (shapely.area(cumulative) > shapely.area(orange))
+        accepted = accepted.reshape(-1, num_layers)
+        cumulative_grid = cumulative.reshape(-1, num_layers)
+        previous = np.repeat(orange_geoms[districts_index][:, None], num_layers, axis=1)
+        for i in range(1, num_layers):
+            previous[:, i] = np.where(accepted[:, i - 1], cumulative_grid[:, i - 1], previous[:, i - 1])
         
-        # 创建橙色渐变层
-        for i in range(num_layers):
-            # 计算每层的扩展距离
-            layer_distance = (i + 1) * max_distance / num_layers
-            
-            # 向外扩展橙色区域
-            expanded_geom = orange_geom.buffer(layer_distance)
-            
-            # 确保在蓝色区域内
-            layer_geom = expanded_geom.intersection(blue_geom)
-            
-            if not layer_geom.is_empty and layer_geom.area > orange_geom.area:
-                # 减去内层的所有区域
-                for j in range(i):
-                    if j < len(layers):
-                        layer_geom = layer_geom.difference(layers[j]['geometry'])
-                
-                # 减去橙色核心区域
-                layer_geom = layer_geom.difference(orange_geom)
-                
-                if not layer_geom.is_empty:
-                    # 计算橙色渐变（从橙色渐变到透明）
-                    # 使用固定的橙色，只改变透明度
-                    orange_rgb = base_color
-                    
-                    # 透明度从内到外递减
-                    alpha_ratio = 1 - (i / num_layers)  # 从1到0
-                    final_alpha = 0.8 * alpha_ratio  # 最高透明度0.8，向外递减
-                    
-                    layers.append({
-                        'geometry': layer_geom,
-                        'color': orange_rgb,
-                        'alpha': max(0.1, final_alpha)  # 最小透明度0.1，避免完全透明
-                    })
-    
+        layer_geoms = np.full(accepted.shape, None, dtype=object)
+        layer_geoms[accepted] = shapely.difference(cumulative_grid[accepted], previous[accepted])
     except Exception as e:
         print(f"创建橙色渐变层时出错: {e}")
         return []
     
+    # 按区域记录 buffer 次数（每个有渐变的区域每层一次）
+    if tracing.is_enabled():
+        for j in districts_index:
+            tracing.event('gradient_district', {'buffer': num_layers}, district=districts[j])
+    
+    layers = []
+    for row, j in enumerate(districts_index):
+        for i in range(num_layers):
+            layer_geom = layer_geoms[row, i]
+            if layer_geom is None or layer_geom.is_empty:
+                continue
+            # 透明度从内到外递减：最高 0.8，最小 0.1
+            final_alpha = 0.8 * (1 - (i / num_layers))
+            layers.append({
+                'geometry': layer_geom,
+                'color': base_colors[j],
+                'alpha': max(0.1, final_alpha),
+                'district': districts[j],
+            })
     return layers
 
-def create_map_for_year(year, name_display_mode='partial'):
+def compute_year_insets(year):
     """
-    为指定年份创建地图
-    
+    计算指定年份的橙色核心和验证结果（不含渐变层）
+
     Parameters:
     year: 年份
-    name_display_mode: 区域名称显示模式
-        - 'all': 显示所有区域名称
-        - 'partial': 只显示有数据的区域名称
-        - 'none': 不显示任何区域名称
+
+    Returns:
+    dict: 与 compute_year_geometry 结构相同的几何结果，gradient_layers 为空
     """
+    import shapely
+    import inset_index
+    
+    # 计算和绘图使用（可能已简化的）几何体，面积比例验证以原始几何体为准
+    gdf = get_render_gdf()
+    original_areas = get_gdf().geometry.area
+    
     print(f"\n正在处理 {year} 年的数据...")
-    print(f"  区域名称显示模式: {name_display_mode}")
     
     # 创建该年份的比例字典
     orange_ratios = {}
     
     # 从CSV中读取该年份的数据
-    year_data = ratio_df.set_index('district')[year]
+    year_data = get_ratio_df().set_index('district')[year]
     
     for district_name, orange_value in year_data.items():
         if pd.notna(orange_value):  # 检查是否为空值
@@ -158,7 +382,7 @@ def create_map_for_year(year, name_display_mode='partial'):
     customer_nums = {}
     
     # 从客户数量CSV中读取该年份的数据
-    customer_year_data = customer_df.set_index('district')[year]
+    customer_year_data = get_customer_df().set_index('district')[year]
     
     for district_name, customer_value in customer_year_data.items():
         if pd.notna(customer_value):  # 检查是否为空值
@@ -173,91 +397,74 @@ def create_map_for_year(year, name_display_mode='partial'):
         min_customer = max_customer = 0
     
     # 为每个行政区创建精确比例的橙色区域
-    orange_areas = []
-    orange_colors = []  # 存储每个区域对应的颜色
     matched_regions = []  # 存储有CSV数据的区域
     blank_regions = []    # 存储没有CSV数据的区域（白色填充）
     validation_results = []  # 存储验证结果
+    inset_idx = get_inset_index()
 
-    for idx, region in gdf.iterrows():
-        # 获取区域名称并标准化
-        region_name = region['name'].lower() if 'name' in region else str(idx)
+    # 先按区域顺序区分有数据和空白的区域，再对所有有数据的区域批量求解
+    region_names = [region_name.lower() for region_name in gdf['name']] if 'name' in gdf.columns \
+        else [str(idx) for idx in gdf.index]
+    is_matched = np.array([region_name in orange_ratios for region_name in region_names], dtype=bool)
+    matched_positions = np.flatnonzero(is_matched)
+    matched_names = [region_names[i] for i in matched_positions]
+    # 原始区域几何体
+    blue_geoms = np.asarray(gdf.geometry.values)[matched_positions]
+    
+    target_ratios = np.array([orange_ratios[region_name] for region_name in matched_names])
+    # 简化改变了区域面积时，换算为相对简化后区域的比例，使结果相对原始面积仍然准确
+    original_matched_areas = original_areas.values[matched_positions]
+    solver_ratios = target_ratios * (original_matched_areas / shapely.area(blue_geoms))
+    
+    with tracing.span('inset', year=year, districts=len(matched_names)):
+        # 查询内缩索引：曲线插值 + 一两次buffer校正得到目标面积比例，所有区域的每一步合并为一次 buffer
+        curves = [inset_index.get_curve(inset_idx, blue_geom) for blue_geom in blue_geoms]
+        _, orange_geoms, buffer_counts = inset_index.solve_insets(
+            blue_geoms, solver_ratios, curves, tolerance=render_settings['inset_tolerance'])
+        # 按区域记录 buffer 次数
+        if tracing.is_enabled():
+            for region_name, buffers in zip(matched_names, buffer_counts):
+                tracing.event('inset_district', {'buffer': int(buffers)}, year=year, district=region_name)
         
-        # 原始区域几何体
-        blue_geom = region.geometry
-        original_area = blue_geom.area
+        # 确保橙色区域在蓝色区域内部
+        nonempty = ~shapely.is_empty(orange_geoms)
+        orange_geoms[nonempty] = shapely.intersection(orange_geoms[nonempty], blue_geoms[nonempty])
         
-        # 直接使用中文名称查找对应的橙色比例
-        if region_name in orange_ratios:
-            target_ratio = orange_ratios[region_name]
-            
-            # 使用迭代方法找到合适的buffer距离来达到目标面积比例
-            target_area = original_area * target_ratio
-            
-            # 二分法查找合适的buffer距离
-            min_buffer = -50000  # 最大内缩50km
-            max_buffer = 0       # 不扩大
-            tolerance = 0.01     # 面积误差容忍度
-            
-            best_buffer = 0
-            for _ in range(50):  # 最多迭代50次
-                mid_buffer = (min_buffer + max_buffer) / 2
-                buffered_geom = blue_geom.buffer(mid_buffer)
-                
-                if buffered_geom.is_empty:
-                    min_buffer = mid_buffer
-                    continue
-                    
-                current_area = buffered_geom.area
-                area_ratio = current_area / original_area
-                
-                if abs(area_ratio - target_ratio) < tolerance:
-                    best_buffer = mid_buffer
-                    break
-                elif area_ratio > target_ratio:
-                    max_buffer = mid_buffer
-                else:
-                    min_buffer = mid_buffer
-            
-            # 生成最终的橙色区域
-            orange_geom = blue_geom.buffer(best_buffer)
-            
-            # 确保橙色区域在蓝色区域内部
-            if not orange_geom.is_empty:
-                orange_geom = orange_geom.intersection(blue_geom)
-            
-            if orange_geom.is_empty:
-                # 如果buffer操作导致空几何体，使用较小的内缩距离
-                orange_geom = blue_geom.buffer(-100)  # 内缩100米
-                if orange_geom.is_empty:
-                    orange_geom = blue_geom  # 如果还是空的，就使用原始几何体
-            
-            # 计算实际面积比例
-            actual_orange_area = orange_geom.area
-            actual_ratio = actual_orange_area / original_area
-            
-            # 存储有数据的区域
-            orange_areas.append(orange_geom)
-            orange_colors.append(calculate_color_by_customer_num(customer_nums.get(region_name), min_customer, max_customer))
+        # 如果buffer操作导致空几何体，使用较小的内缩距离（内缩100米），还是空的就使用原始几何体
+        empty = shapely.is_empty(orange_geoms)
+        if empty.any():
+            fallback = shapely.buffer(blue_geoms[empty], -100, quad_segs=16)
+            fallback = np.where(shapely.is_empty(fallback), blue_geoms[empty], fallback)
+            orange_geoms[empty] = fallback
+    
+    # 计算实际面积比例
+    actual_ratios = shapely.area(orange_geoms) / original_matched_areas if len(orange_geoms) else np.array([])
+    
+    # 存储每个区域的橙色区域和对应的颜色
+    orange_areas = list(orange_geoms)
+    orange_colors = [calculate_color_by_customer_num(customer_nums.get(region_name), min_customer, max_customer)
+                     for region_name in matched_names]
+    matched_rows = dict(zip(matched_positions, range(len(matched_positions))))
+    for position, (idx, region) in enumerate(gdf.iterrows()):
+        if position in matched_rows:
+            # 存储有数据的区域并保存验证结果
+            j = matched_rows[position]
             matched_regions.append(region)
-            
-            # 保存验证结果
+            target_ratio = float(target_ratios[j])
+            actual_ratio = float(actual_ratios[j])
             validation_results.append({
-                'district': region_name,
+                'district': region_names[position],
                 'target_ratio': target_ratio,
                 'actual_ratio': actual_ratio,
                 'error': abs(actual_ratio - target_ratio),
                 'error_percent': abs(actual_ratio - target_ratio) / target_ratio * 100 if target_ratio != 0 else 0,
                 'status': 'matched'
             })
-            
         else:
             # 没有找到对应比例，作为空白区域处理
             blank_regions.append(region)
-            
-            # 保存验证结果
             validation_results.append({
-                'district': region_name,
+                'district': region_names[position],
                 'target_ratio': None,
                 'actual_ratio': None,
                 'error': None,
@@ -265,97 +472,56 @@ def create_map_for_year(year, name_display_mode='partial'):
                 'status': 'blank'
             })
 
-    # 绘图
-    fig, ax = plt.subplots(figsize=(12, 10))
-
-    # 1. 先画空白区域（白色填充）
-    if blank_regions:
-        blank_gdf = gpd.GeoDataFrame(blank_regions)
-        blank_gdf.plot(ax=ax, color='white', edgecolor='black', linewidth=0.5, alpha=1.0)
-
-    # 2. 再画有数据区域的蓝色底色
-    if matched_regions:
-        matched_gdf = gpd.GeoDataFrame(matched_regions)
-        matched_gdf.plot(ax=ax, color='#1E90FF', alpha=0.4, edgecolor='black', linewidth=0.5)
-
-    # 3. 为每个区域创建渐变效果
-    all_gradient_layers = []
-    for i, (orange_geom, blue_region, orange_color) in enumerate(zip(orange_areas, matched_regions, orange_colors)):
-        # 获取蓝色区域的几何形状
-        blue_geom = blue_region.geometry if hasattr(blue_region, 'geometry') else blue_region
-        gradient_layers = create_gradient_layers(orange_geom, blue_geom, orange_color, num_layers=8)
-        all_gradient_layers.extend(gradient_layers)
-    
-    # 4. 绘制渐变层（从外到内）
-    for layer in reversed(all_gradient_layers):  # 从外层到内层绘制
-        try:
-            gpd.GeoSeries([layer['geometry']]).plot(
-                ax=ax, 
-                color=layer['color'], 
-                alpha=layer['alpha'], 
-                edgecolor='none'
-            )
-        except Exception as e:
-            print(f"绘制渐变层时出错: {e}")
-            continue
+    # 保存新计算的索引曲线，供后续年份和下次运行复用
+    inset_index.save_index(inset_idx, inset_index_path)
 
-    # 5. 最后画橙色核心区域
-    if orange_areas:
-        gpd.GeoSeries(orange_areas).plot(
-            ax=ax, color=orange_colors, alpha=0.9, edgecolor='none')
+    return {
+        'year': year,
+        'orange_ratios': orange_ratios,
+        'orange_areas': orange_areas,
+        'orange_colors': orange_colors,
+        'matched_regions': matched_regions,
+        'blank_regions': blank_regions,
+        'gradient_layers': [],
+        'validation_results': validation_results,
+    }
 
-    # 手动创建图例
-    # from matplotlib.patches import Patch
-    # legend_elements = [
-    #     Patch(facecolor='white', edgecolor='black', label='无数据区域'),
-    #     Patch(facecolor='#1E90FF', alpha=0.4, label='流失客户'),
-    #     Patch(facecolor='#FFA500', alpha=0.9, label='回厂客户'),
-    # ]
+def add_gradient_layers(year_geometry):
+    """为 compute_year_insets 的结果生成矢量渐变层，写入 year_geometry['gradient_layers']"""
+    matched_regions = year_geometry['matched_regions']
+    # 记录所属区域（与验证结果相同的区域标识），供矢量导出使用
+    names = [region['name'].lower() if 'name' in region else str(region.name) for region in matched_regions]
+    blue_geoms = [region.geometry for region in matched_regions]
+    with tracing.span('gradient', year=year_geometry['year'], districts=len(matched_regions)):
+        year_geometry['gradient_layers'] = create_gradient_layers_batch(
+            year_geometry['orange_areas'], blue_geoms, year_geometry['orange_colors'], names,
+            num_layers=render_settings['gradient_layers'])
+    return year_geometry
 
-    # 美化图层
-    # plt.title(f"{year}年北京各区客户分布情况（橙色渐变效果）", fontsize=16, fontweight='bold')
-    # plt.legend(handles=legend_elements, loc='upper right', fontsize=12)
+def compute_year_geometry(year, vector_gradients=None):
+    """
+    计算指定年份的几何结果（橙色核心、渐变层、验证结果）
 
-    # 添加区域名称标注
-    for idx, region in gdf.iterrows():
-        # 获取区域的中心点
-        centroid = region.geometry.centroid
-        region_name = region['name'] if 'name' in region else f"区域{idx}"
-        
-        # 根据显示模式决定是否显示区域名称
-        if name_display_mode == 'all':
-            # 显示所有区域名称
-            plt.text(centroid.x, centroid.y, region_name, 
-                     fontsize=10, ha='center', va='center',
-                     bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8, edgecolor='gray'),
-                     fontweight='bold')
-        elif name_display_mode == 'partial':
-            # 只显示有数据的区域名称
-            if region_name.lower() in orange_ratios:
-                plt.text(centroid.x, centroid.y, region_name, 
-                         fontsize=10, ha='center', va='center',
-                         bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8, edgecolor='gray'),
-                         fontweight='bold')
-        elif name_display_mode == 'none':
-            # 不显示任何区域名称
-            pass
-
-    plt.axis('off')
-    plt.tight_layout()
-    
-    # 根据显示模式创建不同的输出子目录
-    mode_dir = os.path.join(output_dir, name_display_mode)
-    os.makedirs(mode_dir, exist_ok=True)
-    
-    # 保存图片
-    output_file = os.path.join(mode_dir, f"{year}.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
-    print(f"  已保存：{output_file}")
-    
-    # 显示图片
-    plt.show()
-    
-    # 输出匹配情况统计
+    该结果与区域名称显示模式无关，可供 'all'、'partial'、'none' 三种模式复用
+
+    Parameters:
+    year: 年份
+    vector_gradients: 是否生成矢量渐变层；None 时由渲染后端决定（栅格渲染不需要）
+
+    Returns:
+    dict: 包含 year、orange_ratios、orange_areas、orange_colors、matched_regions、
+          blank_regions、gradient_layers、validation_results 的几何结果
+    """
+    year_geometry = compute_year_insets(year)
+    # 为每个区域创建渐变效果（栅格渲染直接由距离变换生成渐变，不需要矢量渐变层）
+    if vector_gradients is None:
+        vector_gradients = render_settings['renderer'] != 'raster'
+    if vector_gradients:
+        add_gradient_layers(year_geometry)
+    return year_geometry
+
+def print_validation_summary(year, validation_results):
+    """输出指定年份的匹配情况和面积误差统计"""
     matched_count = len([r for r in validation_results if r['status'] == 'matched'])
     blank_count = len([r for r in validation_results if r['status'] == 'blank'])
 
@@ -372,77 +538,1175 @@ def create_map_for_year(year, name_display_mode='partial'):
 
         print(f"  {year}年平均误差：{avg_error:.4f} ({avg_error*100:.2f}%)")
         print(f"  {year}年最大误差：{max_error:.4f} ({max_error*100:.2f}%) in {max_error_district['district']}")
+
+def get_frame_path(year, mode):
+    """获取指定年份和显示模式的地图文件路径（扩展名由输出格式决定）"""
+    import frame_output
+    return os.path.join(output_dir, mode, f"{year}{frame_output.FORMAT_EXTENSIONS[render_settings['output_format']]}")
+
+def get_geometry_hash():
+    """计算地理边界数据的哈希值（每个进程只计算一次）"""
+    if 'geometry_hash' not in _data_cache:
+        import shapely
+        import build_manifest
+        
+        gdf = get_gdf()
+        names = gdf['name'].tolist() if 'name' in gdf.columns else []
+        _data_cache['geometry_hash'] = build_manifest.hash_inputs(
+            b''.join(shapely.to_wkb(gdf.geometry.values)), names)
+    return _data_cache['geometry_hash']
+
+def frame_input_hash(year, mode):
+    """计算单张地图的输入哈希：该年份的比例和客户数量数据、几何体、显示模式和渲染参数"""
+    import build_manifest
+    
+    ratio_csv = get_ratio_df()[['district', year]].to_csv(index=False)
+    customer_csv = get_customer_df()[['district', year]].to_csv(index=False)
+    return build_manifest.hash_inputs(
+        ratio_csv, customer_csv, get_geometry_hash(), mode, render_settings)
+
+def animation_input_hash(years, mode, fmt, scale):
+    """计算动画的输入哈希：所有帧的输入哈希和动画参数"""
+    import build_manifest
+    
+    frame_hashes = [frame_input_hash(year, mode) for year in years]
+    return build_manifest.hash_inputs(frame_hashes, fmt, scale, animation_duration)
+
+def get_vector_layer_groups(year_geometry):
+    """
+    按绘制顺序返回矢量图层：底色、渐变层（从外到内）、橙色核心
+
+    Returns:
+    list: [(名称, 几何体列表, 填充色列表, 边框色列表或 'none', 边框宽度)]
+    """
+    import matplotlib.colors as mcolors
+    
+    orange_areas = year_geometry['orange_areas']
+    orange_colors = year_geometry['orange_colors']
+    matched_regions = year_geometry['matched_regions']
+    blank_regions = year_geometry['blank_regions']
+
+    # 1. 空白区域（白色填充）和有数据区域的蓝色底色
+    base_geoms = [region.geometry for region in blank_regions] + \
+                 [region.geometry for region in matched_regions]
+    base_faces = [BLANK_FACE] * len(blank_regions) + [MATCHED_FACE] * len(matched_regions)
+    base_edges = [BLANK_EDGE] * len(blank_regions) + [MATCHED_EDGE] * len(matched_regions)
+
+    # 2. 渐变层（从外到内绘制）
+    gradient_layers = list(reversed(year_geometry['gradient_layers']))
+    
+    # 3. 橙色核心区域
+    return [
+        ('base', base_geoms, base_faces, base_edges, 0.5),
+        ('gradient', [layer['geometry'] for layer in gradient_layers],
+         [mcolors.to_rgba(layer['color'], layer['alpha']) for layer in gradient_layers], 'none', 0),
+        ('core', orange_areas, [mcolors.to_rgba(color, 0.9) for color in orange_colors], 'none', 0),
+    ]
+
+class FrameRenderer:
+    """
+    逐帧复用的地图渲染器
+
+    图形、所有区域的路径（底色和边框）以及区域名称标注只创建一次；每帧只更新底色集合的颜色
+    和标注的可见性，并替换渐变层和橙色核心（栅格渲染时只替换填充图像的数据）。
+    所有帧共用同一个图形，图形不经过 pyplot 管理，内存占用不随帧数增长。
+    """
+
+    def __init__(self, gdf):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        
+        get_pyplot()  # 设置中文字体
+        self.gdf = gdf[~gdf.geometry.is_empty]
+        self.raster = render_settings['renderer'] == 'raster'
+        self.fig = Figure(figsize=render_settings['figsize'])
+        FigureCanvasAgg(self.fig)
+        self.ax = ax = self.fig.add_subplot()
+        ax.set_aspect('equal')
+        
+        # 静态图层：区域路径只转换一次，每帧只修改填充色和边框色
+        count = len(self.gdf)
+        self.base = draw_polygon_collection(
+            ax, list(self.gdf.geometry), [BLANK_FACE] * count, [BLANK_EDGE] * count, linewidth=0.5)
+        
+        if self.raster:
+            # 栅格填充图像会把坐标范围收紧到图像边界，这里按默认边距固定与矢量渲染相同的坐标范围
+            min_x, min_y, max_x, max_y = self.gdf.total_bounds
+            margin_x, margin_y = ax.margins()
+            ax.set_xlim(min_x - (max_x - min_x) * margin_x, max_x + (max_x - min_x) * margin_x)
+            ax.set_ylim(min_y - (max_y - min_y) * margin_y, max_y + (max_y - min_y) * margin_y)
+        else:
+            ax.autoscale_view()
+        # 之后添加的图层都在区域范围内，固定坐标范围
+        ax.set_autoscale_on(False)
+        
+        # 区域名称标注：位置固定，每帧只切换可见性
+        self.labels = []
+        for idx, region in self.gdf.iterrows():
+            centroid = region.geometry.centroid
+            region_name = region['name'] if 'name' in region else f"区域{idx}"
+            self.labels.append((region_name, ax.text(
+                centroid.x, centroid.y, region_name,
+                fontsize=10, ha='center', va='center',
+                bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8, edgecolor='gray'),
+                fontweight='bold', visible=False)))
+        
+        ax.axis('off')
+        # 布局只计算一次：坐标轴已关闭，各帧的布局相同。计算后清除布局引擎，
+        # 否则 savefig 每次都会为重新布局多绘制一遍
+        self.fig.tight_layout()
+        self.fig.set_layout_engine(None)
+        self.dynamic = []
+        self.image = None
+        # 按分辨率缓存的输出范围，以及按 (可见标注, 分辨率) 缓存的标注叠加层
+        self.bboxes = {}
+        self.overlays = {}
+
+    def render(self, year_geometry, name_display_mode='partial'):
+        """
+        更新为指定年份和显示模式
+
+        Parameters:
+        year_geometry: compute_year_geometry 返回的几何结果
+        name_display_mode: 区域名称显示模式
+            - 'all': 显示所有区域名称
+            - 'partial': 只显示有数据的区域名称
+            - 'none': 不显示任何区域名称
+
+        Returns:
+        matplotlib Figure（由调用方保存，下一帧会被覆盖）
+        """
+        import raster_render
+        
+        # 1. 底色和边框：有数据的区域为蓝色底色、半透明边框
+        matched = {region.name for region in year_geometry['matched_regions']}
+        is_matched = [idx in matched for idx in self.gdf.index]
+        if self.raster:
+            self.base.set_facecolors([(0, 0, 0, 0)] * len(is_matched))
+        else:
+            self.base.set_facecolors([MATCHED_FACE if m else BLANK_FACE for m in is_matched])
+        self.base.set_edgecolors([MATCHED_EDGE if m else BLANK_EDGE for m in is_matched])
+        
+        # 2. 替换随年份变化的图层
+        for artist in self.dynamic:
+            artist.remove()
+        self.dynamic = []
+        if self.raster:
+            # 填充图像与名称显示模式无关，每个年份只合成一次
+            if 'raster_fill' not in year_geometry:
+                year_geometry['raster_fill'] = raster_render.render_fill_layers(
+                    year_geometry, self.gdf.total_bounds, get_pixel_size(self.gdf))
+            image, extent = year_geometry['raster_fill']
+            if self.image is None:
+                self.image = self.ax.imshow(image, extent=extent, origin='upper', interpolation='antialiased')
+            else:
+                self.image.set_data(image)
+                self.image.set_extent(extent)
+        else:
+            # 渐变层（从外到内）和橙色核心
+            for name, geoms, faces, edges, linewidth in get_vector_layer_groups(year_geometry)[1:]:
+                if not geoms:
+                    continue
+                try:
+                    collection = draw_polygon_collection(self.ax, geoms, faces, edges, linewidth=linewidth)
+                except Exception as e:
+                    if name != 'gradient':
+                        raise
+                    print(f"绘制渐变层时出错: {e}")
+                    continue
+                if collection is not None:
+                    self.dynamic.append(collection)
+        
+        # 3. 区域名称
+        visible = self.visible_labels(year_geometry, name_display_mode)
+        for i, (region_name, label) in enumerate(self.labels):
+            label.set_visible(i in visible)
+
+        return self.fig
+
+    def visible_labels(self, year_geometry, name_display_mode):
+        """返回指定显示模式下需要显示的标注序号"""
+        if name_display_mode == 'all':
+            return frozenset(range(len(self.labels)))
+        if name_display_mode == 'partial':
+            orange_ratios = year_geometry['orange_ratios']
+            return frozenset(i for i, (region_name, _) in enumerate(self.labels)
+                             if region_name.lower() in orange_ratios)
+        return frozenset()
+
+    def _print_rgba(self, dpi, bbox, transparent=False):
+        """按固定输出范围栅格化当前图形，返回 RGBA 数组"""
+        import io
+
+        self.fig.savefig(io.BytesIO(), format='rgba', dpi=dpi, bbox_inches=bbox,
+                         facecolor='none' if transparent else None)
+        # savefig 之后 Agg 画布缓冲区就是输出图像，下次绘制会覆盖，需要复制
+        return np.array(self.fig.canvas.buffer_rgba())
+
+    def _get_bbox(self, dpi):
+        """
+        输出范围：显示全部标注时的紧凑范围加上默认留白
+
+        所有显示模式使用同一范围，底图和标注叠加层的像素才能逐一对齐
+        """
+        if dpi not in self.bboxes:
+            import matplotlib
+
+            visibility = [label.get_visible() for _, label in self.labels]
+            for _, label in self.labels:
+                label.set_visible(True)
+            original_dpi = self.fig.dpi
+            self.fig.dpi = dpi
+            try:
+                bbox = self.fig.get_tightbbox(self.fig.canvas.get_renderer())
+            finally:
+                self.fig.dpi = original_dpi
+                for (_, label), was_visible in zip(self.labels, visibility):
+                    label.set_visible(was_visible)
+            self.bboxes[dpi] = bbox.padded(matplotlib.rcParams['savefig.pad_inches'])
+        return self.bboxes[dpi]
+
+    def _get_overlay(self, visible, dpi):
+        """
+        获取标注叠加层：只绘制指定标注的透明图像，只保留不透明像素
+
+        标注位置固定，叠加层只与可见标注和分辨率有关，'all' 模式的叠加层所有年份共用
+
+        Returns:
+        tuple: (像素的展平序号, 这些像素的 RGBA 值)
+        """
+        key = (visible, dpi)
+        if key not in self.overlays:
+            hidden = [self.base, self.image] + self.dynamic
+            for artist in hidden:
+                if artist is not None:
+                    artist.set_visible(False)
+            for i, (_, label) in enumerate(self.labels):
+                label.set_visible(i in visible)
+            try:
+                with tracing.span('label_overlay', labels=len(visible), dpi=dpi):
+                    overlay = self._print_rgba(dpi, self._get_bbox(dpi), transparent=True).reshape(-1, 4)
+            finally:
+                for artist in hidden:
+                    if artist is not None:
+                        artist.set_visible(True)
+            index = np.flatnonzero(overlay[:, 3])
+            self.overlays[key] = (index, overlay[index])
+        return self.overlays[key]
+
+    def render_images(self, year_geometry, modes, dpi):
+        """
+        栅格化指定年份的所有显示模式
+
+        各显示模式只有区域名称标注不同：不含标注的底图只绘制一次，
+        各模式的图像由底图与缓存的标注叠加层按透明度混合得到
+
+        Parameters:
+        year_geometry: compute_year_geometry 返回的几何结果
+        modes: 显示模式列表
+        dpi: 分辨率
+
+        Returns:
+        dict: 显示模式 -> RGBA 数组（不同模式可能共用同一个数组，调用方不应修改）
+        """
+        self.render(year_geometry, 'none')
+        with tracing.span('base_layer', year=year_geometry['year'], dpi=dpi):
+            base = self._print_rgba(dpi, self._get_bbox(dpi))
+
+        images = {}
+        for mode in modes:
+            visible = self.visible_labels(year_geometry, mode)
+            if not visible:
+                images[mode] = base
+                continue
+            index, pixels = self._get_overlay(visible, dpi)
+            with tracing.span('composite', mode=mode, pixels=len(index)):
+                # 底图不透明，按叠加层透明度混合 RGB，只计算有标注的像素
+                image = base.copy()
+                flat = image.reshape(-1, 4)
+                alpha = pixels[:, 3:].astype(np.uint32)
+                below = flat[index, :3].astype(np.uint32)
+                flat[index, :3] = ((pixels[:, :3] * alpha + below * (255 - alpha) + 127) // 255).astype(np.uint8)
+            images[mode] = image
+        return images
+
+def get_frame_renderer():
+    """获取当前进程复用的帧渲染器（首次调用时创建）"""
+    if 'frame_renderer' not in _data_cache:
+        _data_cache['frame_renderer'] = FrameRenderer(get_render_gdf())
+    return _data_cache['frame_renderer']
+
+def save_frame(image, output_file, writer=None, on_saved=None):
+    """
+    按 render_settings 中的输出格式编码并保存一帧
+
+    Parameters:
+    image: RGBA 数组
+    output_file: 输出文件路径
+    writer: 可选的 frame_output.FrameWriter，提供时在后台线程中编码写入
+    on_saved: 可选的回调函数，文件写入完成后调用（参数为文件路径）
+    """
+    import frame_output
+    
+    options = (render_settings['output_format'], render_settings['compress_level'], render_settings['dpi'])
+    if writer is not None:
+        # 队列已满时在这里等待后台线程
+        with tracing.span('frame_queue', path=output_file):
+            writer.submit(image, output_file, *options, callback=on_saved)
+        return
+    frame_output.encode_frame(image, output_file, *options)
+    if on_saved is not None:
+        on_saved(output_file)
+
+def render_maps_for_year(year_geometry, modes, frame_sinks=None, writer=None, on_saved=None):
+    """
+    根据已计算的几何结果绘制并保存多个显示模式的地图
+
+    不含标注的底图只绘制一次，各模式由底图与标注叠加层合成（见 FrameRenderer.render_images）
+
+    Parameters:
+    year_geometry: compute_year_geometry 返回的几何结果
+    modes: 显示模式列表
+    frame_sinks: 可选，{显示模式: 帧回调函数}，接收渲染好的帧（numpy 数组），用于流式生成动画
+    writer: 可选的 frame_output.FrameWriter，提供时编码和写盘在后台线程中进行，函数返回时文件可能尚未写完
+    on_saved: 可选的回调函数，某个模式的文件写入完成后调用（参数为显示模式）
+
+    Returns:
+    dict: 显示模式 -> 输出文件路径
+    """
+    year = year_geometry['year']
+    frame_sinks = frame_sinks or {}
+
+    print(f"  绘制 {year} 年地图，区域名称显示模式: {', '.join(modes)}")
+    with tracing.span('draw', modes=','.join(modes), year=year):
+        images = get_frame_renderer().render_images(year_geometry, modes, render_settings['dpi'])
+
+    output_files = {}
+    for mode in modes:
+        # 根据显示模式创建不同的输出子目录
+        output_file = get_frame_path(year, mode)
+        callback = None
+        if on_saved is not None:
+            callback = lambda path, mode=mode: on_saved(mode)
+        save_frame(images[mode], output_file, writer, callback)
+        print(f"  {'已提交' if writer is not None else '已保存'}：{output_file}")
+
+        # 直接把合成好的图像交给动画编码器，不再从磁盘读回
+        if mode in frame_sinks:
+            with tracing.span('animation_frame', mode=mode, year=year):
+                frame_sinks[mode](images[mode])
+        output_files[mode] = output_file
+
+    return output_files
+
+def render_map_for_year(year_geometry, name_display_mode='partial', frame_sink=None):
+    """
+    根据已计算的几何结果绘制并保存地图
+    
+    Parameters:
+    year_geometry: compute_year_geometry 返回的几何结果
+    name_display_mode: 区域名称显示模式
+        - 'all': 显示所有区域名称
+        - 'partial': 只显示有数据的区域名称
+        - 'none': 不显示任何区域名称
+    frame_sink: 可选的回调函数，接收渲染好的帧（numpy 数组），用于流式生成动画
+
+    Returns:
+    str: 输出文件路径
+    """
+    frame_sinks = {name_display_mode: frame_sink} if frame_sink is not None else None
+    return render_maps_for_year(year_geometry, [name_display_mode], frame_sinks)[name_display_mode]
+
+def render_frame_bytes(year, name_display_mode='partial', dpi=None, fmt='png'):
+    """
+    在内存中渲染指定年份和模式的地图，返回图片数据（不写入文件，供渲染服务使用）
+
+    每个年份的几何结果在当前进程中只计算一次
+
+    Parameters:
+    year: 年份
+    name_display_mode: 区域名称显示模式
+    dpi: 分辨率，默认使用 render_settings['dpi']
+    fmt: 图片格式，如 'png'、'jpg'、'webp'、'svg'、'pdf'
+
+    Returns:
+    bytes: 图片数据
+    """
+    import io
+    
+    year_geometries = _data_cache.setdefault('year_geometry', {})
+    if year not in year_geometries:
+        year_geometries[year] = compute_year_geometry(year)
+    
+    fig = get_frame_renderer().render(year_geometries[year], name_display_mode)
+    buffer = io.BytesIO()
+    with tracing.span('savefig', mode=name_display_mode, year=year, dpi=dpi, format=fmt):
+        fig.savefig(buffer, format=fmt, dpi=dpi or render_settings['dpi'], bbox_inches='tight')
+    return buffer.getvalue()
+
+def create_map_for_year(year, name_display_mode='partial'):
+    """
+    为指定年份创建地图
+    
+    Parameters:
+    year: 年份
+    name_display_mode: 区域名称显示模式
+        - 'all': 显示所有区域名称
+        - 'partial': 只显示有数据的区域名称
+        - 'none': 不显示任何区域名称
+    """
+    year_geometry = compute_year_geometry(year)
+    render_map_for_year(year_geometry, name_display_mode)
+    print_validation_summary(year, year_geometry['validation_results'])
+    
+    return year_geometry['validation_results']
+
+def prepare_inset_index():
+    """预先计算所有有数据区域的内缩曲线并写入磁盘，避免多个工作进程重复计算；同时删除不再使用的曲线"""
+    import inset_index
+    
+    inset_idx = get_inset_index()
+    districts = set(get_ratio_df()['district'].str.lower())
+    geoms = []
+    for idx, region in get_render_gdf().iterrows():
+        region_name = region['name'].lower() if 'name' in region else str(idx)
+        if region_name in districts:
+            with tracing.span('inset_curve', district=region_name):
+                inset_index.get_curve(inset_idx, region.geometry)
+            geoms.append(region.geometry)
+    # 删除边界数据或简化参数变化后留下的旧曲线
+    inset_index.prune_index(inset_idx, geoms)
+    inset_index.save_index(inset_idx, inset_index_path)
+    return True
+
+def _init_render_worker(worker_gdf, worker_ratio_df, worker_customer_df):
+    """工作进程初始化：使用非交互式 Agg 后端，并一次性接收投影后的地理数据和数据表"""
+    get_pyplot().switch_backend('Agg')
+    _data_cache['gdf'] = worker_gdf
+    _data_cache['ratio_df'] = worker_ratio_df
+    _data_cache['customer_df'] = worker_customer_df
+
+def render_year(year, modes, frame_sinks=None, force=False, writer=None):
+    """
+    计算指定年份的几何结果并绘制所有显示模式，返回验证结果
+
+    输入哈希未变化且文件存在的地图会被跳过；所有模式都为最新时不计算几何结果
+    
+    Parameters:
+    year: 年份
+    modes: 显示模式列表
+    frame_sinks: 可选，{显示模式: 帧回调函数}
+    force: 为 True 时忽略构建清单，全部重新绘制
+    writer: 可选的 frame_output.FrameWriter，多个年份共用时下一年份的计算和绘制与本年份的写盘并行；
+        未提供时创建一个，函数返回前等待写完
+    """
+    import contextlib
+    import build_manifest
+    import frame_output
+    from PIL import Image
+    
+    frame_sinks = frame_sinks or {}
+    manifest = build_manifest.load_manifest(manifest_path)
+    frame_hashes = {mode: frame_input_hash(year, mode) for mode in modes}
+    stale_modes = [
+        mode for mode in modes
+        if force or not build_manifest.is_up_to_date(
+            manifest, get_frame_key(year, mode), frame_hashes[mode], get_frame_path(year, mode))
+    ]
+    
+    if stale_modes:
+        with tracing.span('geometry', year=year):
+            year_geometry = compute_year_geometry(year)
+        validation_results = year_geometry['validation_results']
+    else:
+        print(f"\n{year} 年地图均为最新，跳过")
+        validation_results = manifest['outputs'][get_frame_key(year, modes[0])]['validation']
+    
+    if stale_modes:
+        def record_frame(mode):
+            # 文件写入完成后才记录到构建清单
+            build_manifest.update_manifest(manifest_path, {
+                get_frame_key(year, mode): {'hash': frame_hashes[mode], 'validation': validation_results}
+            })
+        
+        # 需要重新绘制的模式共用一次底图渲染
+        with tracing.span('render', modes=','.join(stale_modes), year=year), \
+                (contextlib.nullcontext(writer) if writer is not None else frame_output.FrameWriter()) as frame_writer:
+            render_maps_for_year(year_geometry, stale_modes,
+                                 {mode: frame_sinks[mode] for mode in stale_modes if mode in frame_sinks},
+                                 frame_writer, record_frame)
+    
+    for mode in modes:
+        if mode not in stale_modes:
+            if stale_modes:
+                print(f"  {mode} 模式 {year} 年地图为最新，跳过")
+            # 动画需要重新生成时，未变化的帧从磁盘读取
+            if mode in frame_sinks:
+                with tracing.span('animation_frame', mode=mode, year=year), \
+                        Image.open(get_frame_path(year, mode)) as image:
+                    frame_sinks[mode](image)
+    
+    if stale_modes:
+        print_validation_summary(year, validation_results)
     
     return validation_results
 
-def generate_maps_with_modes(years, modes=['partial']):
+def get_frame_key(year, mode):
+    """构建清单中地图文件的键"""
+    return f"{mode}/{os.path.basename(get_frame_path(year, mode))}"
+
+def get_stale_years(years, modes, force=False):
+    """返回有地图需要重新绘制的年份"""
+    import build_manifest
+    
+    if force:
+        return list(years)
+    manifest = build_manifest.load_manifest(manifest_path)
+    return [
+        year for year in years
+        if any(not build_manifest.is_up_to_date(
+            manifest, get_frame_key(year, mode), frame_input_hash(year, mode), get_frame_path(year, mode))
+            for mode in modes)
+    ]
+
+def is_animation_up_to_date(years, mode, fmt, scale):
+    """判断指定模式的动画是否为最新"""
+    import build_manifest
+    
+    manifest = build_manifest.load_manifest(manifest_path)
+    animation_path = get_animation_path(mode, fmt)
+    return build_manifest.is_up_to_date(
+        manifest, os.path.relpath(animation_path, output_dir),
+        animation_input_hash(years, mode, fmt, scale), animation_path)
+
+def record_animation(years, mode, fmt, scale):
+    """在构建清单中记录已生成的动画"""
+    import build_manifest
+    
+    build_manifest.update_manifest(manifest_path, {
+        os.path.relpath(get_animation_path(mode, fmt), output_dir):
+            {'hash': animation_input_hash(years, mode, fmt, scale)}
+    })
+
+def generate_maps_with_modes(years, modes=['partial'], workers=1,
+                             animation_format=None, animation_scale=1.0, force=False):
     """
     为指定年份和模式生成地图
+
+    每个年份的几何结果只计算一次，再按各显示模式分别绘制；
+    输入没有变化的地图和动画会根据构建清单跳过
     
     Parameters:
     years: 年份列表
     modes: 显示模式列表 ['all', 'partial', 'none']
+    workers: 并行渲染的进程数，1 表示在当前进程中依次渲染
+    animation_format: 同时生成的动画格式（'gif'、'apng'、'webp'），None 表示不生成
+    animation_scale: 动画缩放比例
+    force: 为 True 时忽略构建清单，全部重新生成
     """
-    all_validation_results = {}
+    import animation
+    import frame_output
     
-    for mode in modes:
-        print(f"\n{'='*60}")
-        print(f"正在生成 {mode} 模式的地图...")
-        print(f"{'='*60}")
-        
-        mode_results = {}
-        
-        for year in years:
-            validation_results = create_map_for_year(year, name_display_mode=mode)
-            mode_results[year] = validation_results
-        
-        all_validation_results[mode] = mode_results
+    all_validation_results = {mode: {} for mode in modes}
+    
+    print(f"\n{'='*60}")
+    print(f"正在生成 {', '.join(modes)} 模式的地图...")
+    print(f"{'='*60}")
+    
+    stale_years = get_stale_years(years, modes, force=force)
+    print(f"需要重新绘制的年份：{stale_years}")
+    
+    # 需要重新生成动画的模式
+    animation_modes = []
+    if animation_format:
+        animation_modes = [
+            mode for mode in modes
+            if force or not is_animation_up_to_date(years, mode, animation_format, animation_scale)
+        ]
+        for mode in modes:
+            if mode not in animation_modes:
+                print(f"{mode} 模式动画为最新，跳过")
+    
+    if workers > 1 and len(stale_years) > 1:
+        # 多进程渲染：每个年份一个任务，数据表只在进程初始化时传递一次
+        prepare_inset_index()
+        print(f"使用 {workers} 个进程并行渲染")
+        with ProcessPoolExecutor(max_workers=min(workers, len(stale_years)),
+                                 initializer=_init_render_worker,
+                                 initargs=(get_gdf(), get_ratio_df(), get_customer_df())) as executor:
+            # 子进程中记录的追踪事件随结果一起返回
+            futures = {year: executor.submit(tracing.collect, render_year, year, modes, None, force)
+                       for year in stale_years}
+            year_results = {}
+            for year, future in futures.items():
+                year_results[year], events = future.result()
+                tracing.merge(events)
+        year_results.update({year: render_year(year, modes) for year in years if year not in year_results})
         
+        # 帧在其他进程中渲染，动画从磁盘逐帧读取
+        for mode in animation_modes:
+            create_gif_for_mode(years, mode, fmt=animation_format, scale=animation_scale, force=True)
+    elif animation_modes:
+        # 单进程渲染：每帧渲染完成后直接送入对应模式的动画编码器
+        writers = {}
+        try:
+            for mode in animation_modes:
+                os.makedirs(os.path.join(output_dir, mode), exist_ok=True)
+                writers[mode] = animation.AnimationWriter(
+                    get_animation_path(mode, animation_format), fmt=animation_format,
+                    duration=animation_duration, loop=0, scale=animation_scale)
+            frame_sinks = {mode: writer.add_frame for mode, writer in writers.items()}
+            with frame_output.FrameWriter() as frame_writer:
+                year_results = {year: render_year(year, modes, frame_sinks, force, frame_writer)
+                                for year in years}
+        finally:
+            for writer in writers.values():
+                writer.close()
+        for mode, writer in writers.items():
+            record_animation(years, mode, animation_format, animation_scale)
+            print_animation_summary(writer.path, writer.frame_count)
+    else:
+        # 后台线程写盘，下一年份的计算和绘制与上一年份的编码并行
+        with frame_output.FrameWriter() as frame_writer:
+            year_results = {year: render_year(year, modes, None, force, frame_writer) for year in years}
+    
+    for year in years:
+        for mode in modes:
+            all_validation_results[mode][year] = year_results[year]
+    
+    for mode in modes:
         print(f"\n{mode} 模式地图生成完成！")
-        print(f"共生成 {len(years)} 张地图，保存在 {os.path.join(output_dir, mode)} 目录中")
-        print(f"文件列表：")
+        print(f"共 {len(years)} 张地图，保存在 {os.path.join(output_dir, mode)} 目录中")
+        print("文件列表：")
         for year in years:
-            print(f"  - {year}.png")
+            print(f"  - {os.path.basename(get_frame_path(year, mode))}")
     
     return all_validation_results
 
-def create_gif_for_mode(years, mode='partial'):
-    """为指定模式创建GIF动画"""
-    print(f"\n开始生成 {mode} 模式的GIF动画...")
+def get_animation_path(mode, fmt='gif'):
+    """获取指定模式动画文件的路径"""
+    import animation
+    return os.path.join(output_dir, mode, f"map_animation_{mode}{animation.FORMAT_EXTENSIONS[fmt]}")
+
+def print_animation_summary(animation_path, frame_count):
+    """输出动画生成信息"""
+    print(f"  动画已生成：{animation_path}")
+    print(f"  帧数：{frame_count} 帧")
+    print("  帧率：1帧/秒")
+    print("  循环：无限循环")
+
+def create_gif_for_mode(years, mode='partial', fmt='gif', scale=1.0, force=False):
+    """
+    为指定模式创建动画（默认GIF），逐帧读取已保存的图片并流式编码
+
+    Parameters:
+    years: 年份列表
+    mode: 显示模式
+    fmt: 动画格式 'gif'、'apng' 或 'webp'
+    scale: 缩放比例
+    force: 为 True 时忽略构建清单，重新生成
+    """
+    import animation
+    from PIL import Image
     
-    # 加载指定模式的图片
-    images = []
-    mode_dir = os.path.join(output_dir, mode)
+    print(f"\n开始生成 {mode} 模式的动画...")
     
-    for year in years:
-        img_path = os.path.join(mode_dir, f"{year}.png")
-        if os.path.exists(img_path):
-            img = Image.open(img_path)
-            images.append(img)
-            print(f"  已加载：{year}.png")
-    
-    if images:
-        # 创建GIF动画
-        gif_path = os.path.join(mode_dir, f"map_animation_{mode}.gif")
-        images[0].save(
-            gif_path, 
-            save_all=True, 
-            append_images=images[1:], 
-            duration=1000,  # 每帧持续1秒
-            loop=0  # 无限循环
-        )
-        
-        print(f"  GIF动画已生成：{gif_path}")
-        print(f"  帧数：{len(images)} 帧")
-        print(f"  帧率：1帧/秒")
-        print(f"  循环：无限循环")
-        return gif_path
-    else:
+    animation_path = get_animation_path(mode, fmt)
+    if not force and is_animation_up_to_date(years, mode, fmt, scale):
+        print(f"  动画为最新，跳过：{animation_path}")
+        return animation_path
+    
+    img_paths = [get_frame_path(year, mode) for year in years]
+    img_paths = [img_path for img_path in img_paths if os.path.exists(img_path)]
+    
+    if not img_paths:
         print(f"  未找到 {mode} 模式的图片文件")
         return None
+    
+    # 每次只在内存中保留一帧
+    with tracing.span('animation', mode=mode, format=fmt), \
+            animation.AnimationWriter(animation_path, fmt=fmt, duration=animation_duration,
+                                      loop=0, scale=scale) as writer:
+        for img_path in img_paths:
+            with tracing.span('animation_frame', mode=mode, frame=os.path.basename(img_path)), \
+                    Image.open(img_path) as img:
+                writer.add_frame(img)
+            print(f"  已加载：{os.path.basename(img_path)}")
+    
+    # 只有全部帧都存在时才记录，缺帧的动画下次会重新生成
+    if len(img_paths) == len(years):
+        record_animation(years, mode, fmt, scale)
+    
+    print_animation_summary(animation_path, writer.frame_count)
+    return animation_path
+
+def get_year_values(year):
+    """
+    读取指定年份有数据区域的目标比例和客户数量颜色（不计算几何体）
+
+    Returns:
+    tuple: ({区域名: 比例}, {区域名: RGB 颜色})
+    """
+    year_data = get_ratio_df().set_index('district')[year]
+    orange_ratios = {district_name.lower(): float(value)
+                     for district_name, value in year_data.items() if pd.notna(value)}
+    
+    customer_year_data = get_customer_df().set_index('district')[year]
+    customer_nums = {district_name.lower(): int(value)
+                     for district_name, value in customer_year_data.items() if pd.notna(value)}
+    if customer_nums:
+        min_customer = min(customer_nums.values())
+        max_customer = max(customer_nums.values())
+    else:
+        min_customer = max_customer = 0
+    
+    orange_colors = {name: calculate_color_by_customer_num(customer_nums.get(name), min_customer, max_customer)
+                     for name in orange_ratios}
+    return orange_ratios, orange_colors
+
+def interpolate_year_values(start, end, t):
+    """
+    在两个年份的比例和颜色之间插值
+
+    两年都有数据的区域比例和颜色线性插值；只在前一年有数据的区域核心逐渐缩小为零，
+    只在后一年有数据的区域核心从零开始增长
+
+    Parameters:
+    start, end: get_year_values 的返回值
+    t: 插值位置，0 为前一年，1 为后一年
+
+    Returns:
+    tuple: ({区域名: 比例}, {区域名: RGB 颜色})
+    """
+    start_ratios, start_colors = start
+    end_ratios, end_colors = end
+    orange_ratios = {}
+    orange_colors = {}
+    for name in list(start_ratios) + [name for name in end_ratios if name not in start_ratios]:
+        if name in start_ratios and name in end_ratios:
+            orange_ratios[name] = start_ratios[name] + (end_ratios[name] - start_ratios[name]) * t
+            orange_colors[name] = start_colors[name] + (end_colors[name] - start_colors[name]) * t
+        elif name in start_ratios:
+            if t >= 1:
+                continue
+            orange_ratios[name] = start_ratios[name] * (1 - t)
+            orange_colors[name] = start_colors[name]
+        else:
+            if t <= 0:
+                continue
+            orange_ratios[name] = end_ratios[name] * t
+            orange_colors[name] = end_colors[name]
+    return orange_ratios, orange_colors
+
+def compute_frame_geometry(label, orange_ratios, orange_colors, vector_gradients=None):
+    """
+    快速计算一帧的几何结果，供平滑动画使用
+
+    内缩距离直接在内缩曲线上插值（不做 buffer 校正），每个区域只做一次 buffer；
+    面积比例不保证落在容差内，因此不输出验证结果
+
+    Parameters:
+    label: 帧标识（如 '2023-2024'）
+    orange_ratios: {区域名: 比例}
+    orange_colors: {区域名: RGB 颜色}
+    vector_gradients: 是否生成矢量渐变层；None 时由渲染后端决定
+
+    Returns:
+    dict: 与 compute_year_geometry 结构相同的几何结果（validation_results 为空）
+    """
+    import shapely
+    import inset_index
+    
+    gdf = get_render_gdf()
+    original_areas = get_gdf().geometry.area
+    inset_idx = get_inset_index()
+    if vector_gradients is None:
+        vector_gradients = render_settings['renderer'] != 'raster'
+    
+    matched_regions = []
+    blank_regions = []
+    for idx, region in gdf.iterrows():
+        region_name = region['name'].lower() if 'name' in region else str(idx)
+        if region_name in orange_ratios:
+            matched_regions.append(region)
+        else:
+            blank_regions.append(region)
+    
+    # 所有有数据的区域用一次 buffer 调用完成内缩
+    names = [region['name'].lower() if 'name' in region else str(region.name) for region in matched_regions]
+    blue_geoms = np.array([region.geometry for region in matched_regions], dtype=object)
+    original_matched = np.array([original_areas[region.name] for region in matched_regions])
+    solver_ratios = [orange_ratios[name] * (original / blue_geom.area)
+                     for name, original, blue_geom in zip(names, original_matched, blue_geoms)]
+    distances = np.array([inset_index.interpolate_distance(inset_index.get_curve(inset_idx, blue_geom), ratio)
+                          for blue_geom, ratio in zip(blue_geoms, solver_ratios)])
+    orange_geoms = blue_geoms.copy()
+    inset = distances < 0
+    if inset.any():
+        tracing.count('buffer', int(inset.sum()))
+        orange_geoms[inset] = shapely.intersection(
+            shapely.buffer(blue_geoms[inset], distances[inset], quad_segs=16), blue_geoms[inset])
+    
+    colors = [orange_colors[name] for name in names]
+    gradient_layers = []
+    if vector_gradients:
+        gradient_layers = create_gradient_layers_batch(
+            orange_geoms, blue_geoms, colors, names,
+            num_layers=render_settings['gradient_layers'])
+    
+    return {
+        'year': label,
+        'orange_ratios': orange_ratios,
+        'orange_areas': list(orange_geoms),
+        'orange_colors': colors,
+        'matched_regions': matched_regions,
+        'blank_regions': blank_regions,
+        'gradient_layers': gradient_layers,
+        'validation_results': [],
+    }
+
+def get_smooth_animation_path(mode, fmt='gif'):
+    """获取指定模式平滑动画文件的路径"""
+    import animation
+    return os.path.join(output_dir, mode, f"map_animation_{mode}_smooth{animation.FORMAT_EXTENSIONS[fmt]}")
+
+def smooth_animation_input_hash(years, mode, fmt, settings):
+    """计算平滑动画的输入哈希：所有年份的输入哈希和动画参数"""
+    import animation
+    import build_manifest
+    
+    frame_hashes = [frame_input_hash(year, mode) for year in years]
+    return build_manifest.hash_inputs(frame_hashes, fmt, sorted(settings.items()), animation.TIMING_VERSION)
+
+def create_smooth_animation(years, modes=['partial'], fmt='gif', fps=None, transition=None,
+                            hold=None, dpi=None, force=False):
+    """
+    生成平滑过渡的动画：相邻年份之间按帧率插入过渡帧，比例和颜色逐帧插值
+
+    每帧只计算一次几何结果，各显示模式共用底图（见 FrameRenderer.render_images），
+    渲染好的帧直接送入各模式的动画编码器，不写入单帧图片
+
+    Parameters:
+    years: 年份列表（至少两个）
+    modes: 显示模式列表
+    fmt: 动画格式 'gif'、'apng' 或 'webp'
+    fps: 帧率，默认使用 smooth_animation_settings
+    transition: 相邻年份之间的过渡时长（秒）
+    hold: 每个年份的停留时长（秒）
+    dpi: 帧分辨率
+    force: 为 True 时忽略构建清单，重新生成
+
+    Returns:
+    dict: 显示模式 -> 动画文件路径；年份不足两个时返回 None
+    """
+    import time
+    import animation
+    import build_manifest
+    import inset_index
+    
+    settings = dict(smooth_animation_settings)
+    for name, value in [('fps', fps), ('transition', transition), ('hold', hold), ('dpi', dpi)]:
+        if value is not None:
+            settings[name] = value
+    
+    print(f"\n开始生成 {', '.join(modes)} 模式的平滑动画...")
+    if len(years) < 2:
+        print("  平滑动画至少需要两个年份")
+        return None
+    
+    paths = {mode: get_smooth_animation_path(mode, fmt) for mode in modes}
+    hashes = {mode: smooth_animation_input_hash(years, mode, fmt, settings) for mode in modes}
+    manifest = build_manifest.load_manifest(manifest_path)
+    stale_modes = [
+        mode for mode in modes
+        if force or not build_manifest.is_up_to_date(
+            manifest, os.path.relpath(paths[mode], output_dir), hashes[mode], paths[mode])
+    ]
+    for mode in modes:
+        if mode not in stale_modes:
+            print(f"  {mode} 模式平滑动画为最新，跳过：{paths[mode]}")
+    if not stale_modes:
+        return paths
+    
+    fps = settings['fps']
+    steps = max(1, round(fps * settings['transition']))
+    hold_frames = max(1, round(fps * settings['hold']))
+    # 停留帧与关键帧相同，只渲染一次；编码器把相同的连续帧合并为一帧
+    render_total = len(years) + (steps - 1) * (len(years) - 1)
+    print(f"  帧率 {fps} 帧/秒，每个过渡 {steps} 帧，共渲染 {render_total} 帧，"
+          f"{settings['dpi']}dpi")
+    
+    values = [get_year_values(year) for year in years]
+    renderer = get_frame_renderer()
+    writers = {}
+    rendered = 0
+    start = time.perf_counter()
+    next_report = 0.1
+    
+    def render_frame(label, orange_ratios, orange_colors):
+        nonlocal rendered, next_report
+        with tracing.span('smooth_frame', frame=label):
+            year_geometry = compute_frame_geometry(label, orange_ratios, orange_colors)
+            images = renderer.render_images(year_geometry, stale_modes, settings['dpi'])
+        rendered += 1
+        if rendered / render_total >= next_report or rendered == render_total:
+            elapsed = time.perf_counter() - start
+            remaining = elapsed / rendered * (render_total - rendered)
+            print(f"  进度：{rendered}/{render_total} 帧（{rendered / render_total:.0%}），"
+                  f"已用 {elapsed:.1f}s，预计剩余 {remaining:.1f}s")
+            next_report = (int(rendered / render_total * 10) + 1) / 10
+        return images
+    
+    try:
+        for mode in stale_modes:
+            os.makedirs(os.path.dirname(paths[mode]), exist_ok=True)
+            writers[mode] = animation.AnimationWriter(
+                paths[mode], fmt=fmt, duration=1000 / fps, loop=0)
+        
+        with tracing.span('smooth_animation', modes=','.join(stale_modes), format=fmt, frames=render_total):
+            for i, year in enumerate(years):
+                # 关键帧：停留 hold 秒
+                images = render_frame(year, *values[i])
+                for mode in stale_modes:
+                    for _ in range(hold_frames):
+                        writers[mode].add_frame(images[mode])
+                if i + 1 == len(years):
+                    break
+                # 过渡帧
+                for k in range(1, steps):
+                    label = f"{year}-{years[i + 1]}@{k}/{steps}"
+                    images = render_frame(label, *interpolate_year_values(values[i], values[i + 1], k / steps))
+                    for mode in stale_modes:
+                        writers[mode].add_frame(images[mode])
+    finally:
+        for writer in writers.values():
+            writer.close()
+    
+    # 保存新计算的索引曲线
+    inset_index.save_index(get_inset_index(), inset_index_path)
+    build_manifest.update_manifest(manifest_path, {
+        os.path.relpath(paths[mode], output_dir): {'hash': hashes[mode]} for mode in stale_modes
+    })
+    
+    seconds = (len(years) * hold_frames + (steps - 1) * (len(years) - 1)) / fps
+    for mode in stale_modes:
+        print(f"  动画已生成：{paths[mode]}")
+        print(f"  帧数：{writers[mode].frame_count} 帧，帧率：{fps} 帧/秒，时长：{seconds:.1f} 秒")
+    return paths
+
+def get_tile_dir(year):
+    """获取指定年份瓦片金字塔的目录（瓦片不含区域名称，与显示模式无关）"""
+    return os.path.join(output_dir, 'tiles', str(year))
+
+def get_tile_features(year_geometry):
+    """将某一年份的矢量图层转换为 EPSG:3857 下的瓦片要素表（按绘制顺序排列）"""
+    import geopandas as gpd
+    
+    geoms, faces, edges, widths = [], [], [], []
+    for name, group_geoms, group_faces, group_edges, linewidth in get_vector_layer_groups(year_geometry):
+        geoms.extend(group_geoms)
+        faces.extend(group_faces)
+        edges.extend([(0, 0, 0, 0)] * len(group_geoms) if isinstance(group_edges, str) else group_edges)
+        # 底色边框在瓦片中固定为 1 像素，不随缩放级别变化
+        widths.extend([1.0 if linewidth else 0.0] * len(group_geoms))
+    
+    projected = gpd.GeoSeries(geoms, crs=get_render_gdf().crs).to_crs(epsg=3857)
+    return {
+        'geometries': np.asarray(projected.values, dtype=object),
+        'facecolors': np.array(faces, dtype=np.float64).reshape(-1, 4),
+        'edgecolors': np.array(edges, dtype=np.float64).reshape(-1, 4),
+        'linewidths': np.array(widths, dtype=np.float64),
+    }
+
+def tile_input_hash(year, zoom):
+    """计算某一年份某一缩放级别瓦片的输入哈希"""
+    import build_manifest
+    import tiles
+    
+    return build_manifest.hash_inputs(frame_input_hash(year, 'tiles'), zoom, tiles.TILE_VERSION)
+
+def render_tiles(year, zooms=None, workers=1, force=False):
+    """
+    生成指定年份的 XYZ 瓦片金字塔：map_outputs/tiles/<年份>/<z>/<x>/<y>.png
+
+    瓦片使用 Web 墨卡托投影（EPSG:3857），只包含填充图层和区域边框，不含区域名称。
+    输入未变化的缩放级别根据构建清单跳过。
+
+    Parameters:
+    year: 年份
+    zooms: 缩放级别列表，默认为 tile_zooms 范围内的所有级别
+    workers: 并行渲染瓦片的进程数
+    force: 为 True 时忽略构建清单，重新生成
+
+    Returns:
+    dict: {'tiles': 写入的瓦片数, 'empty': 跳过的空瓦片数}
+    """
+    import shutil
+    import build_manifest
+    import tiles
+    
+    if zooms is None:
+        zooms = range(tile_zooms[0], tile_zooms[1] + 1)
+    tile_dir = get_tile_dir(year)
+    manifest = build_manifest.load_manifest(manifest_path)
+    zoom_hashes = {zoom: tile_input_hash(year, zoom) for zoom in zooms}
+    stale_zooms = [
+        zoom for zoom in zooms
+        if force or not build_manifest.is_up_to_date(
+            manifest, f"tiles/{year}/{zoom}", zoom_hashes[zoom], os.path.join(tile_dir, str(zoom)))
+    ]
+    if not stale_zooms:
+        print(f"{year} 年瓦片均为最新，跳过")
+        return {'tiles': 0, 'empty': 0}
+    
+    with tracing.span('tiles', year=year, zooms=stale_zooms):
+        # 瓦片总是使用矢量图层（栅格渲染后端也生成矢量渐变层）
+        year_geometry = compute_year_geometry(year, vector_gradients=True)
+        features = get_tile_features(year_geometry)
+        
+        # 清除旧瓦片，避免残留已经变为空白的瓦片
+        for zoom in stale_zooms:
+            shutil.rmtree(os.path.join(tile_dir, str(zoom)), ignore_errors=True)
+            os.makedirs(os.path.join(tile_dir, str(zoom)), exist_ok=True)
+        result = tiles.write_pyramid(features, stale_zooms, tile_dir, workers=workers)
+    
+    print(f"  {year} 年瓦片已生成：缩放级别 {stale_zooms}，{result['tiles']} 个瓦片，"
+          f"跳过 {result['empty']} 个空瓦片，保存在 {tile_dir}")
+    build_manifest.update_manifest(manifest_path, {
+        f"tiles/{year}/{zoom}": {'hash': zoom_hashes[zoom]} for zoom in stale_zooms
+    })
+    return result
+
+def generate_tiles(years, zooms=None, workers=1, force=False):
+    """为多个年份生成瓦片金字塔"""
+    return {year: render_tiles(year, zooms, workers=workers, force=force) for year in years}
+
+def get_vector_path(year, fmt='json'):
+    """获取指定年份矢量导出文件的路径"""
+    extension = 'parquet' if fmt == 'parquet' else 'json'
+    return os.path.join(output_dir, 'vector', f"{year}.{extension}")
+
+def get_vector_records(year_geometry):
+    """
+    将某一年份的矢量图层整理为导出记录
+
+    Returns:
+    tuple: (属性字典列表, 几何体列表)，按绘制顺序排列：区域底色、渐变层（从外到内）、橙色核心
+    """
+    import matplotlib.colors as mcolors
+    
+    validation = {result['district']: result for result in year_geometry['validation_results']}
+    # 区域标识与验证结果、渐变层相同（没有 name 列时使用索引）
+    matched_names = [region['name'].lower() if 'name' in region else str(region.name)
+                     for region in year_geometry['matched_regions']]
+    blank_names = [region['name'].lower() if 'name' in region else str(region.name)
+                   for region in year_geometry['blank_regions']]
+    names = {
+        'base': blank_names + matched_names,
+        'gradient': [layer['district'] for layer in reversed(year_geometry['gradient_layers'])],
+        'core': matched_names,
+    }
+    
+    records, geoms = [], []
+    for layer, group_geoms, faces, edges, linewidth in get_vector_layer_groups(year_geometry):
+        for i, geom in enumerate(group_geoms):
+            record = {
+                'layer': layer,
+                'district': names[layer][i],
+                'fill': mcolors.to_hex(faces[i]),
+                'opacity': round(float(faces[i][3]), 4),
+            }
+            if not isinstance(edges, str):
+                record['stroke'] = mcolors.to_hex(edges[i])
+                record['stroke_opacity'] = round(float(edges[i][3]), 4)
+                record['stroke_width'] = linewidth
+            if layer == 'base':
+                result = validation[names[layer][i]]
+                for key in ('status', 'target_ratio', 'actual_ratio', 'error_percent'):
+                    record[key] = result[key]
+            records.append(record)
+            geoms.append(geom)
+    return records, geoms
+
+def vector_input_hash(year, fmt):
+    """计算某一年份矢量导出的输入哈希"""
+    import build_manifest
+    import vector_export
+    
+    return build_manifest.hash_inputs(
+        frame_input_hash(year, 'vector'), fmt,
+        vector_export.EXPORT_VERSION, vector_export.QUANTIZATION_DEGREES)
+
+def export_year_layers(year, fmt='json', force=False):
+    """
+    导出指定年份的区域底色、渐变层、橙色核心和验证结果
+
+    Parameters:
+    year: 年份
+    fmt: 'json'（EPSG:4326 量化差分编码，适合浏览器）或 'parquet'（GeoParquet，保留原始投影和精度，需要 pyarrow）
+    force: 为 True 时忽略构建清单，重新导出
+
+    Returns:
+    str: 输出文件路径；导出失败时返回 False
+    """
+    import geopandas as gpd
+    import build_manifest
+    import vector_export
+    
+    output_file = get_vector_path(year, fmt)
+    key = os.path.relpath(output_file, output_dir)
+    input_hash = vector_input_hash(year, fmt)
+    if not force and build_manifest.is_up_to_date(
+            build_manifest.load_manifest(manifest_path), key, input_hash, output_file):
+        print(f"{year} 年矢量数据为最新，跳过：{output_file}")
+        return output_file
+    
+    with tracing.span('vector_export', year=year, format=fmt):
+        year_geometry = compute_year_geometry(year, vector_gradients=True)
+        records, geoms = get_vector_records(year_geometry)
+        crs = get_render_gdf().crs
+        if fmt == 'parquet':
+            try:
+                vector_export.write_geoparquet(output_file, records, geoms, crs)
+            except ImportError as e:
+                print(f"导出 GeoParquet 失败（需要安装 pyarrow）: {e}")
+                return False
+        else:
+            projected = gpd.GeoSeries(geoms, crs=crs).to_crs(epsg=4326)
+            document = vector_export.build_document(year, records, np.asarray(projected.values, dtype=object))
+            vector_export.write_json(output_file, document)
+    
+    print(f"  {year} 年矢量数据已导出：{output_file}（{len(records)} 个要素，"
+          f"{os.path.getsize(output_file) / 1024:.0f} KB）")
+    build_manifest.update_manifest(manifest_path, {key: {'hash': input_hash}})
+    return output_file
+
+def write_vector_index(years, fmt='json'):
+    """写入矢量导出的索引文件，列出各年份的文件和动画帧间隔，供浏览器端按顺序播放"""
+    import vector_export
+    
+    index = {
+        'version': vector_export.EXPORT_VERSION,
+        'format': fmt,
+        'years': list(years),
+        'files': {year: os.path.basename(get_vector_path(year, fmt)) for year in years},
+        'frame_duration_ms': animation_duration,
+    }
+    index_path = os.path.join(output_dir, 'vector', 'index.json')
+    vector_export.write_json(index_path, index)
+    print(f"矢量数据索引已保存：{index_path}")
+    return index_path
+
+def export_vector_layers(years, fmt='json', force=False):
+    """导出多个年份的矢量图层并写入索引文件"""
+    results = [export_year_layers(year, fmt, force=force) for year in years]
+    if not all(results):
+        return False
+    return write_vector_index(years, fmt)
 
 # 主程序入口函数
-def main(run_mode='single', display_modes=['partial']):
+def main(run_mode='single', display_modes=['partial'], workers=1,
+         animation_format='gif', animation_scale=1.0, force=False):
     """
     主程序入口
     
@@ -452,6 +1716,10 @@ def main(run_mode='single', display_modes=['partial']):
         - 'multiple': 多模式运行
         - 'all': 运行所有模式
     display_modes: 显示模式列表
+    workers: 并行渲染的进程数
+    animation_format: 动画格式 'gif'、'apng' 或 'webp'，None 表示不生成动画
+    animation_scale: 动画缩放比例（如 0.5 生成半尺寸动画）
+    force: 为 True 时忽略构建清单，全部重新生成
     """
     if run_mode == 'all':
         display_modes = ['all', 'partial', 'none']
@@ -459,12 +1727,15 @@ def main(run_mode='single', display_modes=['partial']):
     print(f"开始运行，模式：{run_mode}")
     print(f"显示模式：{display_modes}")
     
-    # 生成地图
-    all_results = generate_maps_with_modes(years, display_modes)
+    # 获取年份列表
+    years = get_years()
+    print(f"发现年份数据：{years}")
+    print(f"将生成 {len(years)} 张地图")
     
-    # 为每种模式生成GIF
-    for mode in display_modes:
-        create_gif_for_mode(years, mode)
+    # 生成地图，同时为每种模式生成动画
+    all_results = generate_maps_with_modes(
+        years, display_modes, workers=workers,
+        animation_format=animation_format, animation_scale=animation_scale, force=force)
     
     print(f"\n{'='*60}")
     print("项目完成！")
@@ -472,7 +1743,8 @@ def main(run_mode='single', display_modes=['partial']):
     for mode in display_modes:
         print(f"  {mode} 模式:")
         print(f"    - {len(years)} 张PNG地图")
-        print(f"    - 1 个GIF动画")
+        if animation_format:
+            print(f"    - 1 个{animation_format.upper()}动画")
         print(f"    - 保存位置：{os.path.join(output_dir, mode)}")
     print(f"{'='*60}")
     
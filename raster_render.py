@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+栅格渲染后端
+
+不再用矢量 buffer 逐层构建渐变圆环，而是：
+1. 把每个区域栅格化为输出分辨率下的标签掩膜（每个像素只属于一个区域）
+2. 在区域裁剪窗口内对橙色核心做欧氏距离变换，按距离直接计算渐变透明度
+3. 在 RGBA numpy 数组中完成所有填充层的合成，作为一张图片绘制
+
+渐变透明度与矢量渲染相同：核心外 alpha = max(0.1, 0.8 * (1 - d / D))，
+D 为核心边界到区域边界的最短距离，超过 D 的部分不绘制渐变；核心 alpha 为 0.9。
+区域边框仍以矢量线条绘制，保持清晰。
+
+距离变换优先使用 scipy.ndimage，未安装 scipy 时使用纯 numpy 实现。
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 底色（与矢量渲染一致）
+BLANK_RGBA = (1.0, 1.0, 1.0, 1.0)
+MATCHED_RGBA = (0x1E / 255, 0x90 / 255, 0xFF / 255, 0.4)
+CORE_ALPHA = 0.9
+
+
+def _rasterize(geom, transform, window):
+    """
+    将多边形栅格化为窗口内的布尔掩膜（内环挖空）
+
+    Parameters:
+    geom: Polygon/MultiPolygon
+    transform: (min_x, max_y, 每像素米数)
+    window: (行起点, 列起点, 高, 宽)
+    """
+    min_x, max_y, pixel_size = transform
+    row0, col0, height, width = window
+    image = Image.new('L', (width, height), 0)
+    draw = ImageDraw.Draw(image)
+
+    def to_pixels(ring):
+        coords = np.asarray(ring.coords)[:, :2]
+        cols = (coords[:, 0] - min_x) / pixel_size - col0
+        rows = (max_y - coords[:, 1]) / pixel_size - row0
+        return list(zip(cols.tolist(), rows.tolist()))
+
+    for polygon in getattr(geom, 'geoms', [geom]):
+        if polygon.is_empty or polygon.geom_type != 'Polygon':
+            continue
+        draw.polygon(to_pixels(polygon.exterior), fill=1)
+        for interior in polygon.interiors:
+            draw.polygon(to_pixels(interior), fill=0)
+    return np.asarray(image, dtype=bool)
+
+
+def _window(geom, transform, shape, pad=1):
+    """计算几何体在栅格中的裁剪窗口 (行起点, 列起点, 高, 宽)"""
+    min_x, max_y, pixel_size = transform
+    bounds = geom.bounds
+    col0 = max(int(np.floor((bounds[0] - min_x) / pixel_size)) - pad, 0)
+    col1 = min(int(np.ceil((bounds[2] - min_x) / pixel_size)) + pad, shape[1])
+    row0 = max(int(np.floor((max_y - bounds[3]) / pixel_size)) - pad, 0)
+    row1 = min(int(np.ceil((max_y - bounds[1]) / pixel_size)) + pad, shape[0])
+    return row0, col0, row1 - row0, col1 - col0
+
+
+def _row_distance(features):
+    """每行内到最近特征像素的距离（一维精确距离，无特征时为无穷大）"""
+    height, width = features.shape
+    index = np.arange(width, dtype=np.float64)
+    big = np.where(features, 0.0, np.inf)
+    # 左侧最近特征：min_k<=j (big[k] - k) + j，右侧同理
+    left = np.minimum.accumulate(big - index, axis=1) + index
+    right = (np.minimum.accumulate((big + index)[:, ::-1], axis=1)[:, ::-1]) - index
+    return np.minimum(left, right)
+
+
+def distance_transform(background, max_distance):
+    """
+    欧氏距离变换：每个 True 像素到最近 False 像素的距离
+
+    未安装 scipy 时先按行求一维距离，再在列方向上对 max_distance 范围内的偏移取最小值；
+    max_distance 以内的结果是精确的，更远的像素统一返回 max_distance。
+    """
+    try:
+        from scipy import ndimage
+        return ndimage.distance_transform_edt(background)
+    except ImportError:
+        pass
+
+    limit = int(np.ceil(max_distance))
+    row_squared = np.minimum(_row_distance(~background), limit) ** 2
+    squared = row_squared.copy()
+    for offset in range(1, limit + 1):
+        step = offset * offset
+        np.minimum(squared[offset:], row_squared[:-offset] + step, out=squared[offset:])
+        np.minimum(squared[:-offset], row_squared[offset:] + step, out=squared[:-offset])
+    return np.minimum(np.sqrt(squared), max_distance)
+
+
+def _composite(target, mask, rgb, alpha):
+    """
+    在 RGBA 浮点数组上按 "over" 规则叠加一层颜色（非预乘 alpha）
+
+    Parameters:
+    target: (高, 宽, 4) 数组，原地修改
+    mask: 需要叠加的像素
+    rgb: 颜色 (r, g, b)，取值 0-1
+    alpha: 标量或与 mask 中 True 像素一一对应的透明度数组
+    """
+    below = target[mask]
+    below_alpha = below[:, 3]
+    out_alpha = alpha + below_alpha * (1 - alpha)
+    weight = np.divide(alpha, out_alpha, out=np.zeros_like(out_alpha), where=out_alpha > 0)
+    below[:, :3] += (np.asarray(rgb)[None, :] - below[:, :3]) * weight[:, None]
+    below[:, 3] = out_alpha
+    target[mask] = below
+
+
+def render_fill_layers(year_geometry, bounds, pixel_size):
+    """
+    将空白区域、有数据区域底色、渐变和橙色核心合成为一张 RGBA 图像
+
+    Parameters:
+    year_geometry: compute_year_geometry 返回的几何结果
+    bounds: 图像覆盖范围 (min_x, min_y, max_x, max_y)
+    pixel_size: 每像素对应的米数
+
+    Returns:
+    tuple: (RGBA uint8 数组, imshow 使用的 extent)
+    """
+    import matplotlib.colors as mcolors
+
+    min_x, min_y, max_x, max_y = bounds
+    width = int(np.ceil((max_x - min_x) / pixel_size))
+    height = int(np.ceil((max_y - min_y) / pixel_size))
+    transform = (min_x, max_y, pixel_size)
+    shape = (height, width)
+
+    # 标签掩膜：0 为背景，i + 1 为第 i 个区域；相邻区域共用的边界像素只归属一个区域
+    regions = list(year_geometry['blank_regions']) + list(year_geometry['matched_regions'])
+    labels = np.zeros(shape, dtype=np.int32)
+    windows = []
+    for i, region in enumerate(regions):
+        window = _window(region.geometry, transform, shape)
+        row0, col0, h, w = window
+        mask = _rasterize(region.geometry, transform, window)
+        labels[row0:row0 + h, col0:col0 + w][mask] = i + 1
+        windows.append(window)
+
+    canvas = np.zeros(shape + (4,), dtype=np.uint8)
+    num_blank = len(year_geometry['blank_regions'])
+    matched = zip(year_geometry['matched_regions'], year_geometry['orange_areas'],
+                  year_geometry['orange_colors'])
+
+    # 空白区域直接填充白色
+    canvas[(labels > 0) & (labels <= num_blank)] = np.round(np.array(BLANK_RGBA) * 255)
+
+    for i, (region, orange_geom, orange_color) in enumerate(matched, start=num_blank):
+        row0, col0, h, w = windows[i]
+        district = labels[row0:row0 + h, col0:col0 + w] == i + 1
+        if not district.any():
+            continue
+
+        layer = np.zeros((h, w, 4), dtype=np.float64)
+        layer[district] = MATCHED_RGBA
+        rgb = mcolors.to_rgb(orange_color)
+
+        if not orange_geom.is_empty:
+            core = _rasterize(orange_geom, transform, windows[i]) & district
+            # 核心边界到区域边界的最短距离，与矢量渲染的渐变范围一致
+            falloff = orange_geom.boundary.distance(region.geometry.boundary) / pixel_size
+            if core.any() and falloff > 0:
+                distance = distance_transform(~core, falloff + 1)
+                ring = district & ~core & (distance <= falloff)
+                alpha = np.maximum(0.1, 0.8 * (1 - distance[ring] / falloff))
+                _composite(layer, ring, rgb, alpha)
+            _composite(layer, core, rgb, CORE_ALPHA)
+
+        window_canvas = canvas[row0:row0 + h, col0:col0 + w]
+        window_canvas[district] = np.round(layer[district] * 255).astype(np.uint8)
+
+    extent = (min_x, min_x + width * pixel_size, max_y - height * pixel_size, max_y)
+    return canvas, extent
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+本地渲染服务
+
+常驻进程：启动时加载地理边界和数据表并预先计算内缩索引，之后按 HTTP 请求渲染地图，
+不必每次都重新启动 Python、导入 geopandas、从头运行 map.main。
+
+接口：
+    GET /render?year=2024&mode=partial&dpi=150&format=png   地图图片
+    GET /report                                             客户流失率分析报告（文本）
+    GET /years                                              可用年份、显示模式和格式（JSON）
+    GET /stats                                              缓存统计（JSON）
+
+渲染结果保存在按字节数限制容量的 LRU 缓存中；未命中时交给工作进程池渲染，
+多个并发请求同一帧时只渲染一次。工作进程启动时一次性接收数据表，
+并在进程内缓存每个年份的几何结果。服务期间数据文件的修改需要重启服务才会生效。
+
+用法：
+    python service.py --port 8000 --workers 4 --cache-mb 256
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAP_MODES = ['all', 'partial', 'none']
+
+# 支持的图片格式及对应的 Content-Type
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+
+# 默认分辨率 100dpi：像素数约为 300dpi 整图的九分之一，交互请求渲染快、传输小；
+# 允许的最高分辨率 300dpi 与 map_outputs 中的整图一致
+DEFAULT_DPI = 100
+MIN_DPI = 20
+MAX_DPI = 300
+
+# 默认缓存容量（MB）
+DEFAULT_CACHE_MB = 256
+
+
+class FrameCache:
+    """按字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """读取缓存，命中时移到最近使用的位置"""
+        data = self.items.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """写入缓存，超出容量时淘汰最久未使用的条目；单个结果超过容量时不缓存"""
+        if len(data) > self.max_bytes:
+            return
+        if key in self.items:
+            self.size -= len(self.items.pop(key))
+        self.items[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'entries': len(self.items),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class RenderService:
+    """
+    管理工作进程池、帧缓存和正在进行的渲染任务
+
+    Parameters:
+    workers: 渲染进程数
+    cache_bytes: 缓存容量（字节）
+    """
+
+    def __init__(self, workers=1, cache_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        import map as map_module
+
+        self.map = map_module
+        self.workers = workers
+        # 预先计算内缩曲线，工作进程只需读取
+        map_module.prepare_inset_index()
+        self.years = map_module.get_years()
+        self.cache = FrameCache(cache_bytes)
+        self.pending = {}
+        self.renders = 0
+        # 渲染完成的回调可能在持有锁的线程中立即执行，因此使用可重入锁
+        self.lock = threading.RLock()
+        self.executor = self._create_pool()
+
+    def _create_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=self.map._init_render_worker,
+            initargs=(self.map.get_gdf(), self.map.get_ratio_df(), self.map.get_customer_df()))
+
+    def _finish(self, key, future):
+        """渲染完成：成功时写入缓存，并移出进行中的任务"""
+        with self.lock:
+            if not future.cancelled() and future.exception() is None:
+                self.cache.put(key, future.result())
+            self.pending.pop(key, None)
+
+    def render(self, year, mode='partial', dpi=DEFAULT_DPI, fmt='png'):
+        """
+        获取渲染结果
+
+        Returns:
+        tuple: (图片数据, 是否命中缓存)
+        """
+        key = (year, mode, dpi, fmt)
+        with self.lock:
+            executor = self.executor
+            data = self.cache.get(key)
+            if data is not None:
+                return data, True
+            # 同一帧正在渲染时等待同一个任务，不重复渲染
+            future = self.pending.get(key)
+            if future is None:
+                future = executor.submit(self.map.render_frame_bytes, year, mode, dpi, fmt)
+                self.pending[key] = future
+                self.renders += 1
+                future.add_done_callback(partial(self._finish, key))
+        try:
+            return future.result(), False
+        except BrokenProcessPool:
+            # 工作进程异常退出（如内存不足），重建进程池，后续请求可以继续处理
+            with self.lock:
+                if self.executor is executor:
+                    print("渲染进程异常退出，重新创建进程池")
+                    self.executor = self._create_pool()
+            raise
+
+    def warm(self, mode='partial', dpi=DEFAULT_DPI, fmt='png'):
+        """预先渲染所有年份，写入缓存"""
+        with self.lock:
+            futures = [self.executor.submit(self.map.render_frame_bytes, year, mode, dpi, fmt)
+                       for year in self.years]
+        for year, future in zip(self.years, futures):
+            with self.lock:
+                self.cache.put((year, mode, dpi, fmt), future.result())
+            print(f"已预先渲染：{year} 年 {mode} 模式")
+
+    def report(self):
+        """分析报告文本（统计结果按数据文件缓存）"""
+        import heatmap
+
+        return heatmap.format_analysis_report(heatmap.get_churn_stats())
+
+    def stats(self):
+        with self.lock:
+            return dict(self.cache.stats(), renders=self.renders, pending=len(self.pending),
+                        workers=self.workers)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_render_query(query, years):
+    """
+    解析并检查 /render 的参数
+
+    Raises:
+    ValueError: 参数缺失或无效
+    """
+    def single(name, default=None):
+        values = query.get(name)
+        return values[-1] if values else default
+
+    year = single('year')
+    if year is None:
+        raise ValueError("缺少参数 year")
+    if year not in years:
+        raise ValueError(f"未知年份 {year}，可用年份：{years}")
+
+    mode = single('mode', 'partial')
+    if mode not in MAP_MODES:
+        raise ValueError(f"未知显示模式 {mode}，可用模式：{MAP_MODES}")
+
+    try:
+        dpi = int(single('dpi', DEFAULT_DPI))
+    except ValueError:
+        raise ValueError("dpi 必须是整数")
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise ValueError(f"dpi 必须在 {MIN_DPI}-{MAX_DPI} 之间")
+
+    fmt = single('format', 'png').lower()
+    if fmt == 'jpeg':
+        fmt = 'jpg'
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"不支持的格式 {fmt}，可用格式：{list(CONTENT_TYPES)}")
+    return year, mode, dpi, fmt
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理（ThreadingHTTPServer 为每个连接创建一个线程）"""
+
+    service = None
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_body(status, body, 'application/json; charset=utf-8')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        routes = {
+            '/render': self.handle_render,
+            '/report': self.handle_report,
+            '/years': self.handle_years,
+            '/stats': self.handle_stats,
+        }
+        handler = routes.get(url.path)
+        if handler is None:
+            self.send_json(404, {'error': f"未知路径 {url.path}", 'paths': list(routes)})
+            return
+        try:
+            handler(query)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def handle_render(self, query):
+        year, mode, dpi, fmt = parse_render_query(query, self.service.years)
+        data, hit = self.service.render(year, mode, dpi, fmt)
+        self.send_body(200, data, CONTENT_TYPES[fmt], {
+            'X-Cache': 'HIT' if hit else 'MISS',
+            'Cache-Control': 'max-age=3600',
+        })
+
+    def handle_report(self, query):
+        self.send_body(200, self.service.report().encode('utf-8'), 'text/plain; charset=utf-8')
+
+    def handle_years(self, query):
+        self.send_json(200, {'years': self.service.years, 'modes': MAP_MODES,
+                             'formats': list(CONTENT_TYPES), 'dpi': [MIN_DPI, MAX_DPI]})
+
+    def handle_stats(self, query):
+        self.send_json(200, self.service.stats())
+
+
+def make_server(service, host='127.0.0.1', port=8000):
+    """创建绑定到指定服务的 HTTP 服务器"""
+    handler = type('BoundRequestHandler', (RequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="地图渲染服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8000, help="监听端口")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="渲染进程数")
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_MB, help="渲染结果缓存容量（MB）")
+    parser.add_argument('--warm', action='store_true',
+                        help=f"启动时预先渲染所有年份（partial 模式，{DEFAULT_DPI}dpi PNG）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    # 服务不显示窗口
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+    service = RenderService(workers=max(1, args.workers), cache_bytes=int(args.cache_mb * 1024 * 1024))
+    if args.warm:
+        service.warm()
+
+    server = make_server(service, args.host, args.port)
+    print(f"渲染服务已启动：http://{args.host}:{args.port}/render?year={service.years[-1]}&mode=partial")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
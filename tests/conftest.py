@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""测试配置：各模块位于仓库根目录，测试时加入导入路径，并使用非交互式绘图后端"""
+import os
+import sys
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
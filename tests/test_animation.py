@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""流式动画编码的帧时长测试"""
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+import animation
+
+
+def _frames(count, size=16):
+    """每帧颜色不同，编码器不会合并相邻帧"""
+    for i in range(count):
+        frame = np.zeros((size, size, 3), dtype=np.uint8)
+        frame[..., 0] = i * 5
+        frame[..., 1] = 255 - i * 5
+        yield frame
+
+
+def _durations(path):
+    """读取各帧的显示时长（毫秒）"""
+    durations = []
+    with Image.open(path) as image:
+        for frame in ImageSequence.Iterator(image):
+            # WebP 读取器在解码帧之后才设置 duration
+            frame.load()
+            durations.append(frame.info['duration'])
+    return durations
+
+
+@pytest.mark.parametrize('fmt', ['gif', 'apng', 'webp'])
+def test_fractional_frame_duration_keeps_total_length(tmp_path, fmt):
+    fps = 24
+    path = str(tmp_path / f"out.{fmt}")
+    with animation.AnimationWriter(path, fmt=fmt, duration=1000 / fps) as writer:
+        for frame in _frames(fps * 2):
+            writer.add_frame(frame)
+
+    durations = _durations(path)
+    assert len(durations) == fps * 2
+    # 两秒的动画总时长为 2000 毫秒，各帧延迟与理想值相差不到一个延迟单位（GIF 为 10 毫秒）
+    assert sum(durations) == 2000
+    unit = 10 if fmt == 'gif' else 1
+    assert all(abs(d - 1000 / fps) < unit for d in durations)
+
+
+def test_repeated_frames_extend_delay(tmp_path):
+    path = str(tmp_path / 'hold.gif')
+    frames = list(_frames(2))
+    with animation.AnimationWriter(path, duration=1000 / 24) as writer:
+        writer.add_frame(frames[0])
+        for _ in range(24):
+            writer.add_frame(frames[1])
+
+    durations = _durations(path)
+    # 25 帧共 1041.7 毫秒，GIF 以厘秒计为 1040 毫秒
+    assert sum(durations) == 1040
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""大矩阵热力图的标注细节测试"""
+import numpy as np
+import pandas as pd
+
+import heatmap
+
+
+def _tables(rows, cols, seed=0):
+    """生成流失率百分比、流失数量透视表"""
+    rng = np.random.default_rng(seed)
+    index = [f"区域{i:04d}" for i in range(rows)]
+    columns = [2000 + j for j in range(cols)]
+    rates = pd.DataFrame(rng.uniform(0, 1, (rows, cols)), index=index, columns=columns)
+    counts = pd.DataFrame(rng.integers(0, 5000, (rows, cols)), index=index, columns=columns)
+    return rates, counts
+
+
+def _draw(rows, cols):
+    import matplotlib.pyplot as plt
+
+    rates, counts = _tables(rows, cols)
+    fig, _ = heatmap.draw_large_heatmap(rates, counts, rates * 100)
+    texts = len(fig.axes[0].texts)
+    plt.close(fig)
+    return texts
+
+
+def test_large_matrix_has_no_cell_text(capsys):
+    # 600x48 的单元格足够大，只有单元格数量上限能关闭标注
+    assert _draw(600, 48) == 0
+    assert '单元格过多' in capsys.readouterr().out
+
+
+def test_medium_matrix_keeps_cell_text():
+    rows, cols = 30, 20
+    assert rows * cols <= heatmap.MAX_ANNOTATED_CELLS
+    assert _draw(rows, cols) == rows * cols
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""内缩距离索引测试"""
+import shapely
+
+import inset_index
+
+
+def _districts(scale):
+    """三个矩形区域，scale 不同时几何体（以及索引键）不同"""
+    return [shapely.box(i * 10000, 0, i * 10000 + 8000 * scale, 6000 * scale) for i in range(3)]
+
+
+def _update(path, geoms):
+    """与 map.prepare_inset_index 相同的流程：计算曲线、删除旧条目、保存"""
+    index = inset_index.load_index(path)
+    for geom in geoms:
+        inset_index.get_curve(index, geom)
+    inset_index.prune_index(index, geoms)
+    inset_index.save_index(index, path)
+    return inset_index.load_index(path)
+
+
+def test_index_does_not_grow_after_geometry_changes(tmp_path):
+    path = str(tmp_path / 'inset_index.json')
+    for scale in (1.0, 0.9, 0.8, 1.0):
+        geoms = _districts(scale)
+        index = _update(path, geoms)
+        assert set(index['entries']) == {inset_index.geometry_hash(geom) for geom in geoms}
+
+
+def test_prune_keeps_current_entries_clean(tmp_path):
+    path = str(tmp_path / 'inset_index.json')
+    geoms = _districts(1.0)
+    _update(path, geoms)
+    index = inset_index.load_index(path)
+    assert inset_index.prune_index(index, geoms) == 0
+    assert not index['dirty']
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+XYZ 瓦片金字塔输出
+
+把某一年份已计算好的空白区域、蓝色底色、渐变层和橙色核心按 Web 墨卡托（EPSG:3857）
+切分为 z/x/y 瓦片，Leaflet、OpenLayers 等前端可以只加载可见范围内的瓦片。
+
+- 用 STRtree 空间索引查询与瓦片相交的要素，每个瓦片只绘制这些要素
+- 要素先按瓦片范围（外扩几个像素）裁剪，高缩放级别下不再绘制整个区域的全部顶点
+- 没有要素或渲染结果完全透明的瓦片不写入文件（前端把缺失的瓦片当作空白）
+- workers 大于 1 时把瓦片分批交给多个进程并行渲染
+
+要素表格式（按绘制顺序排列）：
+    {'geometries': EPSG:3857 几何体数组, 'facecolors': (N, 4) RGBA,
+     'edgecolors': (N, 4) RGBA, 'linewidths': (N,) 边框宽度（像素）}
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 瓦片格式版本，渲染方式变化时需要递增（参与增量构建的输入哈希）
+TILE_VERSION = 1
+
+# 瓦片边长（像素）
+TILE_SIZE = 256
+
+# Web 墨卡托投影范围的一半（米）
+WEB_MERCATOR_HALF = 20037508.342789244
+
+# 裁剪范围向瓦片外扩的像素数，使裁剪产生的边框落在瓦片之外
+CLIP_MARGIN_PIXELS = 4
+
+# 每个并行任务渲染的瓦片数
+TILES_PER_TASK = 64
+
+# 当前进程使用的要素表、空间索引和复用的画布
+_worker = {}
+
+
+def tile_bounds(z, x, y):
+    """瓦片在 EPSG:3857 下的范围 (min_x, min_y, max_x, max_y)"""
+    size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    min_x = -WEB_MERCATOR_HALF + x * size
+    max_y = WEB_MERCATOR_HALF - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def tiles_for_bounds(bounds, z):
+    """返回覆盖指定范围的所有瓦片 (x, y)"""
+    size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    last = 2 ** z - 1
+    min_x, min_y, max_x, max_y = bounds
+    x0 = min(max(int(math.floor((min_x + WEB_MERCATOR_HALF) / size)), 0), last)
+    x1 = min(max(int(math.floor((max_x + WEB_MERCATOR_HALF) / size)), 0), last)
+    y0 = min(max(int(math.floor((WEB_MERCATOR_HALF - max_y) / size)), 0), last)
+    y1 = min(max(int(math.floor((WEB_MERCATOR_HALF - min_y) / size)), 0), last)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def _init_worker(features):
+    """设置当前进程的要素表并建立空间索引"""
+    import shapely
+
+    _worker.clear()
+    _worker['features'] = features
+    _worker['tree'] = shapely.STRtree(features['geometries'])
+
+
+def _get_canvas():
+    """获取复用的瓦片画布：坐标轴铺满整个透明背景的图形"""
+    if 'canvas' not in _worker:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(1, 1), dpi=TILE_SIZE)
+        fig.patch.set_alpha(0)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_axis_off()
+        _worker['canvas'], _worker['ax'] = canvas, ax
+    return _worker['canvas'], _worker['ax']
+
+
+def render_tile(z, x, y):
+    """
+    渲染一个瓦片
+
+    Returns:
+    numpy 数组 (TILE_SIZE, TILE_SIZE, 4)；没有要素或完全透明时返回 None
+    """
+    import shapely
+    from matplotlib.collections import PathCollection
+    from map import geometry_to_path
+
+    features = _worker['features']
+    bounds = tile_bounds(z, x, y)
+    indices = np.sort(_worker['tree'].query(shapely.box(*bounds), predicate='intersects'))
+    if len(indices) == 0:
+        return None
+
+    margin = (bounds[2] - bounds[0]) / TILE_SIZE * CLIP_MARGIN_PIXELS
+    clipped = shapely.clip_by_rect(features['geometries'][indices], bounds[0] - margin,
+                                   bounds[1] - margin, bounds[2] + margin, bounds[3] + margin)
+    paths, kept = [], []
+    for i, geom in zip(indices, clipped):
+        path = geometry_to_path(geom)
+        if path is not None:
+            paths.append(path)
+            kept.append(i)
+    if not paths:
+        return None
+
+    canvas, ax = _get_canvas()
+    for collection in list(ax.collections):
+        collection.remove()
+    ax.add_collection(PathCollection(
+        paths,
+        facecolors=features['facecolors'][kept],
+        edgecolors=features['edgecolors'][kept],
+        linewidths=features['linewidths'][kept] * 72 / TILE_SIZE,  # 像素换算为磅
+    ))
+    ax.set_xlim(bounds[0], bounds[2])
+    ax.set_ylim(bounds[1], bounds[3])
+    canvas.draw()
+
+    image = np.array(canvas.buffer_rgba())
+    if not image[..., 3].any():
+        return None
+    return image
+
+
+def _render_batch(tile_list, out_dir):
+    """渲染一批瓦片并写入 out_dir/z/x/y.png，返回写入的瓦片数"""
+    from PIL import Image
+
+    written = 0
+    for z, x, y in tile_list:
+        image = render_tile(z, x, y)
+        if image is None:
+            continue
+        path = os.path.join(out_dir, str(z), str(x), f"{y}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.fromarray(image, 'RGBA').save(path)
+        written += 1
+    return written
+
+
+def write_pyramid(features, zooms, out_dir, workers=1):
+    """
+    生成瓦片金字塔
+
+    Parameters:
+    features: 要素表（见模块说明）
+    zooms: 缩放级别列表
+    out_dir: 输出目录，瓦片写入 out_dir/z/x/y.png
+    workers: 并行进程数
+
+    Returns:
+    dict: {'tiles': 写入的瓦片数, 'empty': 跳过的空瓦片数}
+    """
+    import shapely
+
+    bounds = shapely.total_bounds(features['geometries'])
+    tile_list = [(z, x, y) for z in zooms for x, y in tiles_for_bounds(bounds, z)]
+    batches = [tile_list[i:i + TILES_PER_TASK] for i in range(0, len(tile_list), TILES_PER_TASK)]
+
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)),
+                                 initializer=_init_worker, initargs=(features,)) as executor:
+            written = sum(executor.map(_render_batch, batches, [out_dir] * len(batches)))
+    else:
+        _init_worker(features)
+        written = sum(_render_batch(batch, out_dir) for batch in batches)
+
+    return {'tiles': written, 'empty': len(tile_list) - written}
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+流水线耗时追踪
+
+以嵌套的 span 记录每个阶段（模式、年份、区域、阶段名）的耗时、调用计数和内存峰值，
+可导出为 JSON 或 Chrome trace 格式（chrome://tracing、Perfetto 可直接打开）。
+
+用法：
+    import tracing
+    tracing.enable()
+    with tracing.span('savefig', mode='partial', year='2024'):
+        ...
+    tracing.count('buffer')          # 计入当前最内层 span
+    tracing.event('inset_district', {'buffer': 3}, district='海淀区')  # 批量计算中按区域记录计数
+    tracing.save('trace.json')
+
+未启用时 span() 返回同一个空上下文管理器，count() 直接返回，开销只有一次标志判断。
+启用状态通过环境变量 MAP_TRACE 传给子进程；子进程中记录的事件用 collect() 随任务结果返回，
+再由主进程 merge() 合并。
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 导出格式版本
+TRACE_VERSION = 1
+
+_enabled = os.environ.get('MAP_TRACE') == '1'
+_events = []
+_local = threading.local()
+
+
+def enable():
+    """开启追踪（子进程通过环境变量继承）"""
+    global _enabled
+    _enabled = True
+    os.environ['MAP_TRACE'] = '1'
+
+
+def is_enabled():
+    return _enabled
+
+
+def peak_rss_mb():
+    """当前进程的内存峰值（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class _NullSpan:
+    """未启用追踪时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """一个计时区间，退出时记录为事件"""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.counts = {}
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        event = {
+            'name': self.name,
+            'args': self.attrs,
+            # perf_counter 在 Linux/Windows 上是系统级单调时钟，不同进程的时间戳可以直接对齐
+            'start': self.start,
+            'duration': duration,
+            'depth': self.depth,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'counts': self.counts,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        if exc_type is not None:
+            event['error'] = exc_type.__name__
+        _events.append(event)
+        return False
+
+
+def span(name, **attrs):
+    """
+    创建计时区间
+
+    Parameters:
+    name: 阶段名
+    attrs: 附加属性，如 mode、year、district
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, attrs)
+
+
+def count(name, value=1):
+    """累加计数到当前最内层 span（如每个区域的 buffer 次数）"""
+    if not _enabled:
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        counts = stack[-1].counts
+        counts[name] = counts.get(name, 0) + value
+
+
+def event(name, counts=None, **attrs):
+    """
+    记录一个不计时的子事件，嵌套在当前最内层 span 下
+
+    用于批量计算中按单个对象记录调用计数，如一次批量求解中每个区域的 buffer 次数
+
+    Parameters:
+    name: 事件名
+    counts: 计数字典，如 {'buffer': 3}
+    attrs: 附加属性，如 year、district
+    """
+    if not _enabled:
+        return
+    stack = getattr(_local, 'stack', None) or []
+    _events.append({
+        'name': name,
+        'args': attrs,
+        'start': time.perf_counter(),
+        'duration': 0.0,
+        'depth': len(stack),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'counts': dict(counts or {}),
+        'peak_rss_mb': None,
+    })
+
+
+def collect(func, *args):
+    """
+    调用函数并取出调用期间记录的事件，供子进程把事件随结果一起返回
+
+    Returns:
+    tuple: (函数返回值, 事件列表)
+    """
+    first = len(_events)
+    result = func(*args)
+    events = _events[first:]
+    del _events[first:]
+    return result, events
+
+
+def merge(events):
+    """合并子进程返回的事件"""
+    _events.extend(events)
+
+
+def get_events():
+    return list(_events)
+
+
+def clear():
+    del _events[:]
+
+
+def summarize(events=None):
+    """
+    按阶段名汇总
+
+    Returns:
+    dict: 阶段名 -> {'calls', 'total', 'max', 'counts', 'peak_rss_mb'}
+    """
+    summary = {}
+    for event in _events if events is None else events:
+        entry = summary.setdefault(event['name'], {
+            'calls': 0, 'total': 0.0, 'max': 0.0, 'counts': {}, 'peak_rss_mb': None})
+        entry['calls'] += 1
+        entry['total'] += event['duration']
+        entry['max'] = max(entry['max'], event['duration'])
+        for name, value in event['counts'].items():
+            entry['counts'][name] = entry['counts'].get(name, 0) + value
+        if event['peak_rss_mb'] is not None:
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'] or 0, event['peak_rss_mb'])
+    return summary
+
+
+def print_summary(events=None):
+    """输出各阶段耗时汇总（按总耗时降序）"""
+    summary = summarize(events)
+    if not summary:
+        return
+    print(f"\n{'阶段':24s}{'次数':>8s}{'总耗时(s)':>12s}{'最长(s)':>10s}{'峰值内存(MB)':>14s}  计数")
+    for name, entry in sorted(summary.items(), key=lambda item: -item[1]['total']):
+        peak = f"{entry['peak_rss_mb']:.0f}" if entry['peak_rss_mb'] is not None else '-'
+        counts = ', '.join(f"{key}={value}" for key, value in sorted(entry['counts'].items()))
+        print(f"{name:24s}{entry['calls']:8d}{entry['total']:12.3f}{entry['max']:10.3f}{peak:>14s}  {counts}")
+
+
+def to_chrome_trace(events=None):
+    """转换为 Chrome trace 格式（完整事件 ph='X'，时间单位为微秒）"""
+    events = _events if events is None else events
+    origin = min((event['start'] for event in events), default=0.0)
+    trace_events = []
+    for event in events:
+        args = dict(event['args'])
+        args.update(event['counts'])
+        if event['peak_rss_mb'] is not None:
+            args['peak_rss_mb'] = round(event['peak_rss_mb'], 1)
+        if 'error' in event:
+            args['error'] = event['error']
+        trace_events.append({
+            'name': event['name'],
+            'cat': 'map',
+            'ph': 'X',
+            'ts': round((event['start'] - origin) * 1e6, 1),
+            'dur': round(event['duration'] * 1e6, 1),
+            'pid': event['pid'],
+            'tid': event['tid'],
+            'args': args,
+        })
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def save(path, fmt='chrome'):
+    """
+    导出追踪结果
+
+    Parameters:
+    path: 输出文件路径
+    fmt: 'chrome'（Chrome trace 格式）或 'json'（原始事件和汇总）
+    """
+    if fmt == 'chrome':
+        data = to_chrome_trace()
+    elif fmt == 'json':
+        data = {'version': TRACE_VERSION, 'events': _events, 'summary': summarize()}
+    else:
+        raise ValueError(f"不支持的追踪格式: {fmt}")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    print(f"追踪结果已保存：{path}")
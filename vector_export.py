@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+矢量图层导出
+
+把某一年份计算好的区域底色、渐变圆环、橙色核心和面积验证结果导出为紧凑的矢量数据，
+浏览器端可以自行绘制动画，下游工具也不必重新求解内缩几何体。
+
+JSON 格式（坐标为 EPSG:4326 经纬度，量化后差分编码）：
+    {
+      "version": 2, "year": "2024", "crs": "EPSG:4326", "encoding": "quantized-delta",
+      "transform": {"scale": [sx, sy], "translate": [tx, ty]},
+      "features": [   # 按绘制顺序：base（区域底色）、gradient（从外到内）、core
+        {"layer": "base", "district": "渝中区", "fill": "#1e90ff", "opacity": 0.4,
+         "stroke": "#000000", "stroke_opacity": 0.4, "status": "matched",
+         "target_ratio": 0.3, "actual_ratio": 0.298, ..., "geometry": [[[x0, y0, dx1, dy1, ...], ...], ...]},
+        ...
+      ]
+    }
+
+district 为与验证结果相同的区域标识（小写的区域名称，边界数据没有 name 列时为行索引）。
+geometry 为多边形列表，每个多边形是环的列表（第一个为外环，其余为内环），
+每个环是整数数组：第一个点为量化坐标，之后每个点为与上一个点的差值，环自动闭合。
+解码：x = 累加值 * sx + tx，y = 累加值 * sy + ty（见 decode_geometry）。
+
+安装了 pyarrow 时也可以导出 GeoParquet（保留原始精度，不做量化）。
+"""
+import json
+import os
+
+import numpy as np
+
+# 导出格式版本
+EXPORT_VERSION = 2
+
+# 量化步长（度），约 1 米
+QUANTIZATION_DEGREES = 1e-5
+
+
+def _encode_ring(ring, translate, scale):
+    """量化并差分编码一个环，退化为不足 3 个点时返回 None"""
+    coords = np.asarray(ring.coords)[:, :2]
+    quantized = np.round((coords - translate) / scale).astype(np.int64)
+    # 去掉量化后重合的相邻点和闭合点
+    keep = np.concatenate([[True], np.any(np.diff(quantized, axis=0) != 0, axis=1)])
+    quantized = quantized[keep]
+    if len(quantized) > 1 and (quantized[0] == quantized[-1]).all():
+        quantized = quantized[:-1]
+    if len(quantized) < 3:
+        return None
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return deltas.ravel().tolist()
+
+
+def encode_geometry(geom, translate, scale):
+    """将 Polygon/MultiPolygon 编码为 [[环, ...], ...]"""
+    polygons = []
+    for polygon in getattr(geom, 'geoms', [geom]):
+        if polygon.is_empty or polygon.geom_type != 'Polygon':
+            continue
+        exterior = _encode_ring(polygon.exterior, translate, scale)
+        if exterior is None:
+            continue
+        rings = [exterior]
+        for interior in polygon.interiors:
+            encoded = _encode_ring(interior, translate, scale)
+            if encoded is not None:
+                rings.append(encoded)
+        polygons.append(rings)
+    return polygons
+
+
+def decode_geometry(encoded, transform):
+    """将编码后的几何体还原为 shapely MultiPolygon"""
+    import shapely
+
+    scale = np.asarray(transform['scale'], dtype=np.float64)
+    translate = np.asarray(transform['translate'], dtype=np.float64)
+    polygons = []
+    for rings in encoded:
+        coords = [np.cumsum(np.asarray(ring, dtype=np.int64).reshape(-1, 2), axis=0) * scale + translate
+                  for ring in rings]
+        polygons.append(shapely.Polygon(coords[0], coords[1:]))
+    return shapely.MultiPolygon(polygons)
+
+
+def build_document(year, records, geometries, crs='EPSG:4326', quantization=QUANTIZATION_DEGREES):
+    """
+    构建 JSON 导出文档
+
+    Parameters:
+    year: 年份
+    records: 每个要素的属性字典列表（按绘制顺序）
+    geometries: 与 records 对应的几何体（已投影到 crs）
+    crs: 坐标系说明
+    quantization: 量化步长（坐标单位）
+
+    Returns:
+    dict: 导出文档
+    """
+    import shapely
+
+    bounds = shapely.total_bounds(np.asarray(geometries, dtype=object))
+    translate = np.array([bounds[0], bounds[1]])
+    scale = np.array([quantization, quantization])
+
+    features = []
+    for record, geom in zip(records, geometries):
+        encoded = encode_geometry(geom, translate, scale)
+        if encoded:
+            features.append(dict(record, geometry=encoded))
+
+    return {
+        'version': EXPORT_VERSION,
+        'year': year,
+        'crs': crs,
+        'encoding': 'quantized-delta',
+        'transform': {'scale': scale.tolist(), 'translate': translate.tolist()},
+        'features': features,
+    }
+
+
+def write_json(path, document):
+    """写入紧凑 JSON（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def write_geoparquet(path, records, geometries, crs):
+    """
+    写入 GeoParquet（需要 pyarrow），保留原始精度
+
+    Raises:
+    ImportError: 未安装 pyarrow
+    """
+    import geopandas as gpd
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    gdf = gpd.GeoDataFrame(records, geometry=list(geometries), crs=crs)
+    gdf.to_parquet(path)